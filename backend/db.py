@@ -1,67 +1,211 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
+from datetime import datetime, timezone
+from sqlalchemy import delete, event, literal_column, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import SQLModel, Field, create_engine, Session, select
+import base64
+import hashlib
 import json
 import os
+import sqlite3
+import urllib.parse
 
 DB_PATH = os.getenv("DB_PATH", "profiles.db")
-engine = create_engine(f"sqlite:///{DB_PATH}", echo=False)
+# SQLite tuning, applied to every pooled connection; WAL lets readers run alongside a writer
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_MB = int(os.getenv("DB_CACHE_MB", "16"))
+DB_MMAP_MB = int(os.getenv("DB_MMAP_MB", "128"))
+# sized for FastAPI's sync-handler threadpool (40 threads by default)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "32"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+def _set_pragmas(dbapi_connection, _):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size={-DB_CACHE_MB * 1024}")  # negative = KiB
+    cursor.execute(f"PRAGMA mmap_size={DB_MMAP_MB * 2**20}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _create_engine(path: str):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        echo=False,
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        # connections are handed between threadpool workers, never shared by two at once
+        connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT_MS / 1000},
+    )
+    event.listen(engine, "connect", _set_pragmas)
+    return engine
+
+
+engine = _create_engine(DB_PATH)
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 
 class ProfileRow(SQLModel, table=True):
-    user_id: int = Field(primary_key=True)
+    # AUTOINCREMENT: ids of deleted profiles are never handed out again
+    __table_args__ = {"sqlite_autoincrement": True}
+    user_id: Optional[int] = Field(default=None, primary_key=True)
     name: Optional[str] = None
-    avatar_data_url: Optional[str] = None
-    account: Optional[str] = Field(default=None, index=True)
-    email: Optional[str] = Field(default=None, index=True)
+    # sha256 of the image in the avatar table; older DBs also have an avatar_data_url column that init_db empties
+    avatar_hash: Optional[str] = None
+    account: Optional[str] = Field(default=None, index=True, unique=True)
+    email: Optional[str] = Field(default=None, index=True, unique=True)
     password_hash: Optional[str] = None
-    genres_json: Optional[str] = None  # JSON-encoded list[str]
-    favorites_json: Optional[str] = None  # JSON-encoded list[str]
-    watchlist_json: Optional[str] = None  # JSON-encoded list[int] (movie IDs)
+    # bumped in the same transaction as every change to the genres or watchlist, so any worker can tell
+    # whether a ranking it cached for this user is still current
+    revision: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    # Legacy JSON-encoded lists; init_db moves them into the tables below and clears them
+    genres_json: Optional[str] = None
+    favorites_json: Optional[str] = None
+    watchlist_json: Optional[str] = None
 
     @staticmethod
     def from_profile_dict(d: dict) -> "ProfileRow":
         return ProfileRow(
             user_id=int(d.get("user_id")),
             name=d.get("name"),
-            avatar_data_url=d.get("avatar_data_url"),
+            avatar_hash=d.get("avatar_hash"),
             account=d.get("account"),
             email=d.get("email"),
             password_hash=d.get("password_hash"),
-            genres_json=json.dumps(d.get("genres") or []),
-            favorites_json=json.dumps(d.get("favorites") or []),
-            watchlist_json=json.dumps(d.get("watchlist") or []),
         )
 
-    def to_profile_dict(self) -> dict:
-        try:
-            genres = json.loads(self.genres_json) if self.genres_json else []
-        except Exception:
-            genres = []
-        try:
-            favorites = json.loads(self.favorites_json) if self.favorites_json else []
-        except Exception:
-            favorites = []
-        try:
-            watchlist = json.loads(self.watchlist_json) if self.watchlist_json else []
-        except Exception:
-            watchlist = []
+    def to_profile_dict(self, genres: Optional[List[str]] = None, favorites: Optional[List[str]] = None,
+                        watchlist: Optional[List[int]] = None) -> dict:
         return {
             "user_id": self.user_id,
             "name": self.name,
-            "avatar_data_url": self.avatar_data_url,
+            "avatar_hash": self.avatar_hash,
             "account": self.account,
             "email": self.email,
             # never expose password_hash in API responses
-            "genres": genres,
-            "favorites": favorites,
-            "watchlist": watchlist,
+            "genres": genres or [],
+            "favorites": favorites or [],
+            "watchlist": watchlist or [],
         }
 
+
+class AvatarRow(SQLModel, table=True):
+    # content-addressed: profiles uploading the same image share one row
+    __tablename__ = "avatar"
+    hash: str = Field(primary_key=True)
+    content_type: str
+    data: bytes
+
+
+class WatchlistRow(SQLModel, table=True):
+    __tablename__ = "watchlist"
+    user_id: int = Field(primary_key=True)
+    movie_id: int = Field(primary_key=True)
+    added_at: datetime = Field(default_factory=_utcnow)
+
+
+class ProfileGenreRow(SQLModel, table=True):
+    __tablename__ = "profile_genre"
+    user_id: int = Field(primary_key=True)
+    genre: str = Field(primary_key=True)
+    position: int = 0
+
+
+class ProfileFavoriteRow(SQLModel, table=True):
+    __tablename__ = "profile_favorite"
+    user_id: int = Field(primary_key=True)
+    favorite: str = Field(primary_key=True)
+    position: int = 0
+
+
+# profile dict key -> (table, value column, ordering); rowid breaks ties between equal timestamps
+_LISTS = {
+    "genres": (ProfileGenreRow, ProfileGenreRow.genre, (ProfileGenreRow.position,)),
+    "favorites": (ProfileFavoriteRow, ProfileFavoriteRow.favorite, (ProfileFavoriteRow.position,)),
+    "watchlist": (WatchlistRow, WatchlistRow.movie_id, (WatchlistRow.added_at, literal_column("watchlist.rowid"))),
+}
+
+
+def _decode_list(raw: Optional[str]) -> list:
+    try:
+        return list(dict.fromkeys(json.loads(raw))) if raw else []
+    except Exception:
+        return []
+
+
+def parse_data_url(url: str) -> Optional[tuple]:
+    """Split a data: URL into (content_type, bytes); None if it is not a valid data URL"""
+    if not url or not url.startswith("data:") or "," not in url:
+        return None
+    header, payload = url[5:].split(",", 1)
+    params = header.split(";")
+    content_type = params[0] or "text/plain"
+    try:
+        if "base64" in params[1:]:
+            return content_type, base64.b64decode(payload, validate=True)
+        return content_type, urllib.parse.unquote_to_bytes(payload)
+    except ValueError:
+        return None
+
+
+def _avatar_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
 def _column_exists(cursor, table: str, column: str) -> bool:
     cursor.execute(f"PRAGMA table_info({table})")
     cols = [row[1] for row in cursor.fetchall()]
     return column in cols
 
 
+def _ensure_unique_index(cursor, table: str, column: str) -> None:
+    # older DBs indexed account/email without UNIQUE; rebuild the index unless duplicates already exist
+    name = f"ix_{table}_{column}"
+    cursor.execute(f"PRAGMA index_list({table})")
+    if any(row[1] == name and row[2] for row in cursor.fetchall()):
+        return
+    cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    try:
+        cursor.execute(f"CREATE UNIQUE INDEX {name} ON {table} ({column})")
+    except sqlite3.IntegrityError:
+        print(f"[db] Duplicate {table}.{column} values found; keeping a non-unique index")
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({column})")
+
+
+def _ensure_autoincrement(cursor) -> None:
+    # older DBs created profilerow without AUTOINCREMENT, so reserve_user_ids has no sequence to raise.
+    # SQLite cannot add it in place: copy the rows into a table created with it and swap the two.
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'profilerow'")
+    if "AUTOINCREMENT" in cursor.fetchone()[0].upper():
+        return
+    cursor.execute("PRAGMA table_info(profilerow)")
+    old_columns = [(row[1], row[2]) for row in cursor.fetchall()]
+    ddl = str(CreateTable(ProfileRow.__table__).compile(engine)).replace("CREATE TABLE profilerow", "CREATE TABLE profilerow_new", 1)
+    cursor.execute("SAVEPOINT profilerow_rebuild")
+    cursor.execute(ddl)
+    for name, type_ in old_columns:
+        if not _column_exists(cursor, "profilerow_new", name):
+            cursor.execute(f"ALTER TABLE profilerow_new ADD COLUMN {name} {type_}")  # e.g. avatar_data_url
+    columns = ", ".join(name for name, _ in old_columns)
+    cursor.execute(f"INSERT INTO profilerow_new ({columns}) SELECT {columns} FROM profilerow")
+    cursor.execute("DROP TABLE profilerow")  # its indexes go with it; init_db recreates them
+    cursor.execute("ALTER TABLE profilerow_new RENAME TO profilerow")
+    cursor.execute("RELEASE profilerow_rebuild")
+
+
 def init_db() -> None:
     # Create tables if not exist
     SQLModel.metadata.create_all(engine)
@@ -75,12 +219,66 @@ def init_db() -> None:
             cursor.execute("ALTER TABLE profilerow ADD COLUMN email TEXT")
         if not _column_exists(cursor, "profilerow", "password_hash"):
             cursor.execute("ALTER TABLE profilerow ADD COLUMN password_hash TEXT")
+        if not _column_exists(cursor, "profilerow", "avatar_hash"):
+            cursor.execute("ALTER TABLE profilerow ADD COLUMN avatar_hash TEXT")
+        if not _column_exists(cursor, "profilerow", "revision"):
+            cursor.execute("ALTER TABLE profilerow ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        _ensure_autoincrement(cursor)
+        _ensure_unique_index(cursor, "profilerow", "account")
+        _ensure_unique_index(cursor, "profilerow", "email")
         if not _column_exists(cursor, "profilerow", "genres_json"):
             cursor.execute("ALTER TABLE profilerow ADD COLUMN genres_json TEXT")
         if not _column_exists(cursor, "profilerow", "favorites_json"):
             cursor.execute("ALTER TABLE profilerow ADD COLUMN favorites_json TEXT")
         if not _column_exists(cursor, "profilerow", "watchlist_json"):
             cursor.execute("ALTER TABLE profilerow ADD COLUMN watchlist_json TEXT")
+        # Move JSON-encoded lists into the normalized tables, then clear them so this runs once
+        cursor.execute(
+            "SELECT user_id, genres_json, favorites_json, watchlist_json FROM profilerow "
+            "WHERE genres_json IS NOT NULL OR favorites_json IS NOT NULL OR watchlist_json IS NOT NULL"
+        )
+        added_at = _utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+        for user_id, genres_json, favorites_json, watchlist_json in cursor.fetchall():
+            cursor.executemany(
+                "INSERT OR IGNORE INTO profile_genre (user_id, genre, position) VALUES (?, ?, ?)",
+                [(user_id, g, pos) for pos, g in enumerate(_decode_list(genres_json))],
+            )
+            cursor.executemany(
+                "INSERT OR IGNORE INTO profile_favorite (user_id, favorite, position) VALUES (?, ?, ?)",
+                [(user_id, f, pos) for pos, f in enumerate(_decode_list(favorites_json))],
+            )
+            cursor.executemany(
+                "INSERT OR IGNORE INTO watchlist (user_id, movie_id, added_at) VALUES (?, ?, ?)",
+                [(user_id, int(m), added_at) for m in _decode_list(watchlist_json)],
+            )
+        cursor.execute("UPDATE profilerow SET genres_json = NULL, favorites_json = NULL, watchlist_json = NULL")
+        # Move inline avatar data URLs into the avatar table; values that do not parse are left in place
+        if _column_exists(cursor, "profilerow", "avatar_data_url"):
+            cursor.execute("SELECT user_id, avatar_data_url FROM profilerow WHERE avatar_data_url IS NOT NULL")
+            for user_id, url in cursor.fetchall():
+                parsed = parse_data_url(url)
+                if parsed is None:
+                    continue
+                content_type, data = parsed
+                digest = _avatar_hash(data)
+                cursor.execute("INSERT OR IGNORE INTO avatar (hash, content_type, data) VALUES (?, ?, ?)",
+                               (digest, content_type, data))
+                cursor.execute("UPDATE profilerow SET avatar_hash = ?, avatar_data_url = NULL WHERE user_id = ?",
+                               (digest, user_id))
+        conn.connection.commit()
+
+
+def reserve_user_ids(max_id: int) -> None:
+    """Make new profiles get ids above max_id, so signups never take the id of a user the models were trained on"""
+    with engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        # only AUTOINCREMENT tables (created by this version) have a sqlite_sequence entry to raise
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'profilerow'", (max_id,))
+        if cursor.rowcount == 0:
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('profilerow', ?)", (max_id,))
         conn.connection.commit()
 
 
@@ -88,47 +286,313 @@ def get_session() -> Session:
     return Session(engine)
 
 
+# The queries below take an open Session, so db_async can run the same code through AsyncSession.run_sync
+
+def _load_profile(session: Session, user_id: int) -> Optional[ProfileRow]:
+    return session.exec(select(ProfileRow).where(ProfileRow.user_id == user_id)).first()
+
+
 def load_profile(user_id: int) -> Optional[ProfileRow]:
     with get_session() as session:
-        return session.exec(select(ProfileRow).where(ProfileRow.user_id == user_id)).first()
+        return _load_profile(session, user_id)
+
+
+def _store_avatar(session: Session, content_type: str, data: bytes) -> str:
+    digest = _avatar_hash(data)
+    session.exec(
+        sqlite_insert(AvatarRow).values(hash=digest, content_type=content_type, data=data).on_conflict_do_nothing()
+    )
+    session.commit()
+    return digest
+
+
+def store_avatar(content_type: str, data: bytes) -> str:
+    """Store image bytes once under their sha256 and return the hash"""
+    with get_session() as session:
+        return _store_avatar(session, content_type, data)
+
+
+def _load_avatar(session: Session, avatar_hash: str) -> Optional[AvatarRow]:
+    return session.exec(select(AvatarRow).where(AvatarRow.hash == avatar_hash)).first()
+
+
+def load_avatar(avatar_hash: str) -> Optional[AvatarRow]:
+    with get_session() as session:
+        return _load_avatar(session, avatar_hash)
+
+
+def _select_list(key: str, user_ids: List[int]):
+    table, column, order = _LISTS[key]
+    return select(table.user_id, column).where(table.user_id.in_(user_ids)).order_by(*order)
+
+
+def _load_lists(session: Session, user_ids: List[int]) -> Dict[int, Dict[str, list]]:
+    lists = {uid: {key: [] for key in _LISTS} for uid in user_ids}
+    for key in _LISTS:
+        for uid, value in session.exec(_select_list(key, user_ids)):
+            lists[uid][key].append(value)
+    return lists
+
+
+def _load_profile_dict(session: Session, user_id: int) -> Optional[dict]:
+    row = _load_profile(session, user_id)
+    if row is None:
+        return None
+    return row.to_profile_dict(**_load_lists(session, [user_id])[user_id])
+
+
+def load_profile_dict(user_id: int) -> Optional[dict]:
+    with get_session() as session:
+        return _load_profile_dict(session, user_id)
+
+
+def load_profile_dicts(user_ids: List[int]) -> List[dict]:
+    ids = list(dict.fromkeys(int(u) for u in user_ids))
+    profiles: List[dict] = []
+    with get_session() as session:
+        # chunk the IN lists to stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = session.exec(select(ProfileRow).where(ProfileRow.user_id.in_(chunk))).all()
+            lists = _load_lists(session, [row.user_id for row in rows])
+            profiles.extend(row.to_profile_dict(**lists[row.user_id]) for row in rows)
+    return profiles
+
+
+def _load_user_list(session: Session, key: str, user_id: int) -> Optional[list]:
+    # one indexed query that also tells a missing user (None) apart from an empty list
+    table, column, order = _LISTS[key]
+    rows = session.exec(
+        select(ProfileRow.user_id, column)
+        .outerjoin(table, table.user_id == ProfileRow.user_id)
+        .where(ProfileRow.user_id == user_id)
+        .order_by(*order)
+    ).all()
+    if not rows:
+        return None
+    return [value for _, value in rows if value is not None]
+
+
+def load_watchlist(user_id: int) -> Optional[List[int]]:
+    """Movie ids in the order they were added, or None if the user does not exist"""
+    with get_session() as session:
+        return _load_user_list(session, "watchlist", user_id)
+
+
+def _load_revision(session: Session, user_id: int) -> Optional[int]:
+    return session.exec(select(ProfileRow.revision).where(ProfileRow.user_id == user_id)).first()
+
+
+def load_user_lists(user_id: int, keys) -> Dict[str, Optional[list]]:
+    """Several of the user's lists (keys of _LISTS) plus "revision" from one session; each is None if the user does not exist.
+
+    The revision is read first: a write landing between the queries leaves lists newer than the revision,
+    which only costs a cache miss later, never a stale hit.
+    """
+    with get_session() as session:
+        lists = {"revision": _load_revision(session, user_id)}
+        lists.update((key, _load_user_list(session, key, user_id)) for key in keys)
+        return lists
+
+
+def _in_watchlist(session: Session, user_id: int, movie_id: int) -> bool:
+    return session.exec(
+        select(WatchlistRow.movie_id).where(WatchlistRow.user_id == user_id, WatchlistRow.movie_id == movie_id)
+    ).first() is not None
+
+
+def in_watchlist(user_id: int, movie_id: int) -> bool:
+    with get_session() as session:
+        return _in_watchlist(session, user_id, movie_id)
+
+
+class ProfileAccessor:
+    """Request-scoped view of one profile; each part is fetched at most once, on first use.
+
+    Its constructor takes the path parameter, so FastAPI handlers can declare it with Depends().
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._cache: dict = {}
+
+    def _cached_list(self, key: str):
+        if key not in self._cache:
+            if "profile" in self._cache:
+                profile = self._cache["profile"]
+                self._cache[key] = None if profile is None else profile[key]
+            else:
+                # handlers that need one list usually need the other too; fetch both in one session
+                self._cache.update(load_user_lists(self.user_id, ("genres", "watchlist")))
+        return self._cache[key]
+
+    def get(self) -> Optional[dict]:
+        if "profile" not in self._cache:
+            self._cache["profile"] = load_profile_dict(self.user_id)
+        return self._cache["profile"]
+
+    def genres(self) -> Optional[List[str]]:
+        return self._cached_list("genres")
+
+    def watchlist(self) -> Optional[List[int]]:
+        return self._cached_list("watchlist")
+
+    def revision(self) -> Optional[int]:
+        """ProfileRow.revision as of (or before) the genres and watchlist this accessor returns"""
+        if "revision" not in self._cache:
+            self._cache.update(load_user_lists(self.user_id, ("genres", "watchlist")))
+        return self._cache["revision"]
+
+
+def _load_profile_by(session: Session, column, value: str) -> Optional[ProfileRow]:
+    return session.exec(select(ProfileRow).where(column == value)).first()
+
+
+def _load_profile_by_login(session: Session, account: str) -> Optional[ProfileRow]:
+    return _load_profile_by(session, ProfileRow.account, account) or _load_profile_by(session, ProfileRow.email, account)
 
 
 def load_profile_by_account(account: str) -> Optional[ProfileRow]:
     with get_session() as session:
-        return session.exec(select(ProfileRow).where(ProfileRow.account == account)).first()
+        return _load_profile_by(session, ProfileRow.account, account)
 
 
 def load_profile_by_email(email: str) -> Optional[ProfileRow]:
     with get_session() as session:
-        return session.exec(select(ProfileRow).where(ProfileRow.email == email)).first()
+        return _load_profile_by(session, ProfileRow.email, email)
 
 
-def next_user_id() -> int:
+class DuplicateProfileError(ValueError):
+    """An insert or update collided with another profile's account or email"""
+
+    def __init__(self, column: Optional[str]):
+        super().__init__(f"{column or 'profile'} already in use")
+        self.column = column
+
+
+def _duplicate_column(exc: IntegrityError) -> Optional[str]:
+    # sqlite reports "UNIQUE constraint failed: profilerow.<column>"
+    message = str(exc.orig)
+    for column in ("account", "email"):
+        if f"profilerow.{column}" in message or f"ix_profilerow_{column}" in message:
+            return column
+    return None
+
+
+def _create_profile(session: Session, data: dict) -> ProfileRow:
+    row = ProfileRow(
+        name=data.get("name"),
+        avatar_hash=data.get("avatar_hash"),
+        account=data.get("account"),
+        email=data.get("email"),
+        password_hash=data.get("password_hash"),
+    )
+    try:
+        session.add(row)
+        session.flush()  # assigns user_id
+        _replace_list(session, "genres", row.user_id, data.get("genres") or [])
+        _replace_list(session, "favorites", row.user_id, data.get("favorites") or [])
+        session.commit()
+    except IntegrityError as exc:
+        session.rollback()
+        raise DuplicateProfileError(_duplicate_column(exc)) from exc
+    session.refresh(row)
+    return row
+
+
+def create_profile(data: dict) -> ProfileRow:
+    """Insert a new profile with a database-assigned user_id, in one transaction.
+
+    Raises DuplicateProfileError if the account or email is already taken.
+    """
     with get_session() as session:
-        row = session.exec(select(ProfileRow.user_id).order_by(ProfileRow.user_id.desc())).first()
-        return int(row or 0) + 1
+        return _create_profile(session, data)
 
 
-def upsert_profile(data: dict) -> ProfileRow:
+def _replace_list(session: Session, key: str, user_id: int, values: list) -> None:
+    table, column, _ = _LISTS[key]
+    session.exec(delete(table).where(table.user_id == user_id))
+    values = list(dict.fromkeys(values))
+    if key == "watchlist":
+        added_at = _utcnow()
+        session.add_all(WatchlistRow(user_id=user_id, movie_id=int(m), added_at=added_at) for m in values)
+    else:
+        session.add_all(table(**{"user_id": user_id, column.key: v, "position": pos}) for pos, v in enumerate(values))
+
+
+def _bump_revision(session: Session, user_id: int) -> None:
+    session.exec(update(ProfileRow).where(ProfileRow.user_id == user_id).values(revision=ProfileRow.revision + 1))
+
+
+def _upsert_profile(session: Session, data: dict) -> ProfileRow:
     row = ProfileRow.from_profile_dict(data)
-    with get_session() as session:
-        existing = session.exec(select(ProfileRow).where(ProfileRow.user_id == row.user_id)).first()
+    try:
+        existing = _load_profile(session, row.user_id)
         if existing is None:
             session.add(row)
         else:
             existing.name = row.name
-            existing.avatar_data_url = row.avatar_data_url
+            existing.avatar_hash = row.avatar_hash
             if row.account is not None:
                 existing.account = row.account
             if row.email is not None:
                 existing.email = row.email
             if row.password_hash is not None:
                 existing.password_hash = row.password_hash
-            existing.genres_json = row.genres_json
-            existing.favorites_json = row.favorites_json
-            if row.watchlist_json is not None:
-                existing.watchlist_json = row.watchlist_json
             row = existing
+        _replace_list(session, "genres", row.user_id, data.get("genres") or [])
+        _replace_list(session, "favorites", row.user_id, data.get("favorites") or [])
+        _replace_list(session, "watchlist", row.user_id, data.get("watchlist") or [])
+        session.flush()
+        _bump_revision(session, row.user_id)
         session.commit()
-        session.refresh(row)
-        return row
+    except IntegrityError as exc:
+        session.rollback()
+        raise DuplicateProfileError(_duplicate_column(exc)) from exc
+    session.refresh(row)
+    return row
+
+
+def upsert_profile(data: dict) -> ProfileRow:
+    with get_session() as session:
+        return _upsert_profile(session, data)
+
+
+def _user_exists(session: Session, user_id: int) -> bool:
+    return session.exec(select(ProfileRow.user_id).where(ProfileRow.user_id == user_id)).first() is not None
+
+
+def _add_to_watchlist(session: Session, user_id: int, movie_id: int) -> Optional[List[int]]:
+    if not _user_exists(session, user_id):
+        return None
+    result = session.exec(
+        sqlite_insert(WatchlistRow)
+        .values(user_id=user_id, movie_id=movie_id, added_at=_utcnow())
+        .on_conflict_do_nothing()
+    )
+    if result.rowcount:
+        _bump_revision(session, user_id)
+    session.commit()
+    return _load_user_list(session, "watchlist", user_id)
+
+
+def add_to_watchlist(user_id: int, movie_id: int) -> Optional[List[int]]:
+    """Insert one (user, movie) row; returns the new list, or None if the user does not exist"""
+    with get_session() as session:
+        return _add_to_watchlist(session, user_id, movie_id)
+
+
+def _remove_from_watchlist(session: Session, user_id: int, movie_id: int) -> Optional[List[int]]:
+    if not _user_exists(session, user_id):
+        return None
+    result = session.exec(delete(WatchlistRow).where(WatchlistRow.user_id == user_id, WatchlistRow.movie_id == movie_id))
+    if result.rowcount:
+        _bump_revision(session, user_id)
+    session.commit()
+    return _load_user_list(session, "watchlist", user_id)
+
+
+def remove_from_watchlist(user_id: int, movie_id: int) -> Optional[List[int]]:
+    """Delete one (user, movie) row; returns the new list, or None if the user does not exist"""
+    with get_session() as session:
+        return _remove_from_watchlist(session, user_id, movie_id)
@@ -0,0 +1,96 @@
+from typing import Optional, List
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db import (
+    DB_PATH, DB_BUSY_TIMEOUT_MS, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, ProfileRow, AvatarRow,
+    _set_pragmas, _load_profile, _load_profile_dict, _load_profile_by_login, _load_user_list, _in_watchlist,
+    _store_avatar, _load_avatar, _create_profile, _upsert_profile, _add_to_watchlist, _remove_from_watchlist,
+)
+
+# Async counterparts of the db.py functions used by the async request handlers. Queries go through
+# aiosqlite, so a handler waiting on SQLite yields the event loop instead of holding a threadpool
+# worker. Each function runs the same session-level code as db.py via AsyncSession.run_sync, on the
+# same database file with the same pragmas; init_db and the batch loaders stay sync-only.
+
+
+def _create_async_engine(path: str):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{path}",
+        echo=False,
+        # aiosqlite defaults to NullPool; keep connections (and their pragmas) open between requests
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        connect_args={"timeout": DB_BUSY_TIMEOUT_MS / 1000},
+    )
+    event.listen(engine.sync_engine, "connect", _set_pragmas)
+    return engine
+
+
+async_engine = _create_async_engine(DB_PATH)
+
+
+def get_async_session() -> AsyncSession:
+    return AsyncSession(async_engine)
+
+
+async def _run(fn, *args):
+    async with get_async_session() as session:
+        return await session.run_sync(fn, *args)
+
+
+async def load_profile(user_id: int) -> Optional[ProfileRow]:
+    return await _run(_load_profile, user_id)
+
+
+async def load_profile_dict(user_id: int) -> Optional[dict]:
+    return await _run(_load_profile_dict, user_id)
+
+
+async def load_profile_by_login(account: str) -> Optional[ProfileRow]:
+    """Profile whose account, or failing that email, equals `account`"""
+    return await _run(_load_profile_by_login, account)
+
+
+async def load_watchlist(user_id: int) -> Optional[List[int]]:
+    """Movie ids in the order they were added, or None if the user does not exist"""
+    return await _run(_load_user_list, "watchlist", user_id)
+
+
+async def in_watchlist(user_id: int, movie_id: int) -> bool:
+    return await _run(_in_watchlist, user_id, movie_id)
+
+
+async def store_avatar(content_type: str, data: bytes) -> str:
+    """Store image bytes once under their sha256 and return the hash"""
+    return await _run(_store_avatar, content_type, data)
+
+
+async def load_avatar(avatar_hash: str) -> Optional[AvatarRow]:
+    return await _run(_load_avatar, avatar_hash)
+
+
+async def create_profile(data: dict) -> ProfileRow:
+    """See db.create_profile; raises DuplicateProfileError if the account or email is already taken"""
+    return await _run(_create_profile, data)
+
+
+async def upsert_profile(data: dict) -> ProfileRow:
+    return await _run(_upsert_profile, data)
+
+
+async def add_to_watchlist(user_id: int, movie_id: int) -> Optional[List[int]]:
+    """Insert one (user, movie) row; returns the new list, or None if the user does not exist"""
+    return await _run(_add_to_watchlist, user_id, movie_id)
+
+
+async def remove_from_watchlist(user_id: int, movie_id: int) -> Optional[List[int]]:
+    """Delete one (user, movie) row; returns the new list, or None if the user does not exist"""
+    return await _run(_remove_from_watchlist, user_id, movie_id)
+
+
+async def dispose() -> None:
+    await async_engine.dispose()
@@ -1,52 +1,197 @@
 import os
+import sys
+import time
+import json
 import argparse
 import pickle
+import numpy as np
 import pandas as pd
 import torch
 from sklearn.model_selection import train_test_split
-from utils.preprocess import load_ratings, load_movies, map_ids
-from models.matrix_factorization import MatrixFactorization
-from models.deep_learning_model import NeuralRecommender, train_model
+from utils.preprocess import load_ratings_indexed, load_movies, IdMap, load_id_maps
+from models.matrix_factorization import MatrixFactorization, SOLVERS, save_artifact, load_artifact
+from models.artifacts import read_manifest
+from models.similarity import INDEX_METHODS
+from models.deep_learning_model import NeuralRecommender, NeuralScorer, load_neural_recommender, train_fast, export_numpy
 
 
-def recommend_top_n(model, user_id, movies, num_items, n=5):
-    predictions = [model.predict(user_id, i) for i in range(num_items)]
-    top_n = sorted(enumerate(predictions), key=lambda x: x[1], reverse=True)[:n]
+def recommend_top_n(model, user_id, movies, item_map, n=5):
+    top_items, top_scores = model.recommend(user_id, n)
+    titles = dict(zip(movies["movieId"].astype(int).tolist(), movies["title"].tolist()))
 
     print(f"\nTop {n} recommended movies for user {user_id}:")
-    for i, score in top_n:
-        movie_title = movies.loc[movies["movieId"] == i, "title"].values
-        title = movie_title[0] if len(movie_title) > 0 else f"Movie {i}"
+    for movie_id, score in zip(item_map.ids[top_items].tolist(), top_scores.tolist()):
+        title = titles.get(movie_id, f"Movie {movie_id}")
         print(f"{title} — Predicted Rating: {score:.2f}")
 
 
-def main(data_path="data/ratings.csv", movies_path="data/movies.csv", test_size=0.2, seed=42):
+def recommend_batch(model, user_ids, movies, out, user_map, item_map, n=5, genres=None, min_year=None, max_year=None,
+                    exclude_watchlist=False, chunk_bytes=64 * 2**20):
+    """Write one NDJSON line of top-n recommendations per raw user id, scoring users in chunks.
+
+    Only users the model was trained on are ranked; anyone else gets a "User not in model" line. Users who
+    signed up since the last training run are folded in from their profile by the API's POST /recommend/batch.
+    """
+    from movies_data import get_catalog
+
+    allowed_mask = None
+    if genres or min_year is not None or max_year is not None:
+        catalog = get_catalog()
+        catalog_mask = catalog.filter_mask(genres, min_year, max_year)
+        allowed_mask = catalog.item_mask(catalog_mask, item_map.index_of(catalog.ids), model.n_items)
+
+    exclude = None
+    if exclude_watchlist:
+        from db import init_db, load_profile_dicts
+        init_db()
+        profiles = load_profile_dicts(user_ids)
+        profile_idxs = user_map.index_of([prof["user_id"] for prof in profiles]).tolist()
+        exclude = {u: item_map.index_of(prof["watchlist"]) for u, prof in zip(profile_idxs, profiles) if u >= 0}
+
+    titles = dict(zip(movies["movieId"].astype(int).tolist(), movies["title"].tolist()))
+    user_idxs = user_map.index_of(user_ids)
+    for u in np.asarray(user_ids)[user_idxs < 0].tolist():
+        out.write(json.dumps({"user_id": u, "recommendations": [], "error": "User not in model"}) + "\n")
+    known = user_idxs[user_idxs >= 0]
+    for u, items, scores in model.recommend_many(known, n, allowed_mask=allowed_mask, exclude=exclude,
+                                                 chunk_bytes=chunk_bytes):
+        recs = [{"movie_id": movie_id, "title": titles.get(movie_id, f"Movie {movie_id}"), "predicted_rating": score}
+                for movie_id, score in zip(item_map.ids[items].tolist(), scores.tolist())]
+        out.write(json.dumps({"user_id": int(user_map.ids[u]), "recommendations": recs}) + "\n")
+
+
+def benchmark_recommend(models, n_users, n=5, sample=200, repeats=3, seed=0):
+    """Print single-user and batched top-n latency for each {name: recommender} on the same random users."""
+    users = np.random.default_rng(seed).integers(0, n_users, size=sample)
+    print(f"\nRecommend latency over {sample} users (n={n}, best of {repeats}):")
+    for name, model in models.items():
+        single = []
+        for u in users.tolist():
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                model.recommend(u, n)
+                best = min(best, time.perf_counter() - start)
+            single.append(best * 1000)
+        batch = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in model.recommend_many(users, n):
+                pass
+            batch = min(batch, time.perf_counter() - start)
+        p50, p95 = np.percentile(single, [50, 95])
+        print(f"{name:>4}: single p50 {p50:.3f} ms  p95 {p95:.3f} ms  |  batch {batch * 1000:.1f} ms "
+              f"({batch * 1e6 / sample:.1f} us/user)")
+
+
+def check_sgd_parity(data_path, sample=2000, epochs=2, seed=0, ratings_cache=True):
+    """Train the "sgd" solver and the original iterrows loop from the same start; True if U and V match bit for bit."""
+    ratings, user_map, item_map = load_ratings_indexed(data_path, f"{data_path}.npz" if ratings_cache else None)
+    df = ratings.sample(min(sample, len(ratings)), random_state=seed)
+    mf = MatrixFactorization(len(user_map), len(item_map), n_factors=8, lr=0.01, reg=0.02, epochs=epochs,
+                             verbose=False, solver="sgd", seed=seed)
+    U, V = mf.U.copy(), mf.V.copy()
+    for _ in range(epochs):
+        # the training loop as it was before the solver options existed
+        for _, row in df.iterrows():
+            u = int(row["user"])
+            i = int(row["item"])
+            r = float(row["rating"])
+            pred = np.dot(U[u], V[i])
+            err = r - pred
+            U[u] += mf.lr * (err * V[i] - mf.reg * U[u])
+            V[i] += mf.lr * (err * U[u] - mf.reg * V[i])
+    mf.train(df)
+    identical = np.array_equal(mf.U, U) and np.array_equal(mf.V, V)
+    print(f"sgd solver vs reference loop ({len(df)} ratings, {epochs} epochs):",
+          "bit-identical" if identical else f"max |dU| {np.abs(mf.U - U).max():.3g}, max |dV| {np.abs(mf.V - V).max():.3g}")
+    return identical
+
+
+def check_minibatch_parity(data_path, test_size=0.2, seed=42, rtol=0.05, ratings_cache=True):
+    """Train "minibatch" and "sgd" with main()'s settings from the same seed; True if their test RMSEs are within rtol of each other.
+
+    The engines visit ratings in different orders and minibatch applies a batch's updates together, so
+    the factors differ; what must hold is that the default engine fits about as well as the reference loop.
+    """
+    ratings, user_map, item_map = load_ratings_indexed(data_path, f"{data_path}.npz" if ratings_cache else None)
+    train, test = train_test_split(ratings, test_size=test_size, random_state=seed)
+    test_arrays = test["user"].to_numpy(), test["item"].to_numpy(), test["rating"].to_numpy()
+    rmse = {}
+    for solver in ("sgd", "minibatch"):
+        mf = MatrixFactorization(len(user_map), len(item_map), n_factors=32, lr=0.01, reg=1e-5, epochs=10,
+                                 verbose=False, solver=solver, seed=seed)
+        mf.train(train)
+        rmse[solver] = mf.rmse(*test_arrays)
+    within = abs(rmse["minibatch"] - rmse["sgd"]) <= rtol * rmse["sgd"]
+    print(f"minibatch vs sgd test RMSE ({len(train)} train / {len(test)} test ratings): "
+          f"{rmse['minibatch']:.4f} vs {rmse['sgd']:.4f}, {'within' if within else 'NOT within'} {rtol:.0%}")
+    return within
+
+
+def neural_id_maps(dl, candidates):
+    """The first (user_ids, item_ids) pair in candidates that has one id per embedding row of dl, or None"""
+    shape = (dl.user_embed.num_embeddings, dl.item_embed.num_embeddings)
+    for user_ids, item_ids in candidates:
+        if user_ids is not None and item_ids is not None and (len(user_ids), len(item_ids)) == shape:
+            return user_ids, item_ids
+    return None
+
+
+def main(data_path="data/ratings.csv", movies_path="data/movies.csv", test_size=0.2, seed=42, mf_solver="minibatch",
+         ratings_cache=True, item_index="exact"):
     print("Loading data...")
-    ratings = load_ratings(data_path)
+    # parsed ratings are cached next to the CSV and reused until the CSV changes
+    ratings, data_user_map, data_item_map = load_ratings_indexed(data_path, f"{data_path}.npz" if ratings_cache else None)
     movies = load_movies(movies_path)
-    ratings, user2idx, item2idx = map_ids(ratings)
-    n_users = len(user2idx)
-    n_items = len(item2idx)
+    n_users = len(data_user_map)
+    n_items = len(data_item_map)
     print(f"Users: {n_users}, Items: {n_items}, Ratings: {len(ratings)}")
 
     train, test = train_test_split(ratings, test_size=test_size, random_state=seed)
 
     os.makedirs("saved_models", exist_ok=True)
-    mf_path = "saved_models/mf_model.pkl"
+    mf_dir = "saved_models/mf"
+    legacy_mf_path = "saved_models/mf_model.pkl"
+    legacy_ids_path = "saved_models/mf_ids.npz"
     dl_path = "saved_models/dl_model.pth"
+    dl_dir = "saved_models/dl"
 
     # --- Matrix Factorization ---
-    if os.path.exists(mf_path):
+    if os.path.isdir(mf_dir):
         print("\nLoading saved Matrix Factorization model...")
-        with open(mf_path, "rb") as f:
+        mf, user_ids, item_ids = load_artifact(mf_dir, mmap_mode=None)
+    elif os.path.exists(legacy_mf_path):
+        print("\nConverting pickled Matrix Factorization model to", mf_dir)
+        with open(legacy_mf_path, "rb") as f:
             mf = pickle.load(f)
+        if os.path.exists(legacy_ids_path):
+            user_map, item_map = load_id_maps(legacy_ids_path)
+        elif (mf.n_users, mf.n_items) == (n_users, n_items):
+            # pickled before id maps were persisted; it was trained on this data's map_ids order
+            user_map, item_map = data_user_map, data_item_map
+        else:
+            user_map, item_map = IdMap(np.arange(mf.n_users)), IdMap(np.arange(mf.n_items))
+        user_ids, item_ids = user_map.ids, item_map.ids
+        save_artifact(mf, mf_dir, user_ids, item_ids)
     else:
-        print("\nTraining Matrix Factorization (SGD)...")
-        mf = MatrixFactorization(n_users, n_items, n_factors=32, lr=0.01, reg=1e-5, epochs=10, verbose=True)
+        print(f"\nTraining Matrix Factorization ({mf_solver})...")
+        # ALS solves each row exactly, so it needs a much stronger ridge term than the SGD updates
+        reg = 5.0 if mf_solver == "als" else 1e-5
+        mf = MatrixFactorization(n_users, n_items, n_factors=32, lr=0.01, reg=reg, epochs=10, verbose=True,
+                                 solver=mf_solver, seed=seed)
         mf.train(train, test)
-        with open(mf_path, "wb") as f:
-            pickle.dump(mf, f)
-        print("Saved Matrix Factorization model to", mf_path)
+        user_ids, item_ids = data_user_map.ids, data_item_map.ids
+        save_artifact(mf, mf_dir, user_ids, item_ids)
+        print("Saved Matrix Factorization model to", mf_dir)
+    if mf.item_neighbors is None:
+        # "more like this" lookups are served from this index, saved alongside the factors
+        print(f"Building item similarity index ({item_index})...")
+        mf.build_item_index(k=50, method=item_index)
+        save_artifact(mf, mf_dir, user_ids, item_ids, model_version=read_manifest(mf_dir)["model_version"])
+    # artifacts saved without id maps assumed model index == raw id
+    user_map = IdMap(np.arange(mf.n_users) if user_ids is None else user_ids)
+    item_map = IdMap(np.arange(mf.n_items) if item_ids is None else item_ids)
 
     # Example prediction
     sample = test.sample(1).iloc[0]
@@ -58,26 +203,79 @@ def main(data_path="data/ratings.csv", movies_path="data/movies.csv", test_size=
     # --- Deep Learning Recommender ---
     if os.path.exists(dl_path):
         print("\nLoading saved Neural Recommender model...")
-        dl = NeuralRecommender(n_users, n_items, n_factors=64, hidden_dims=[128, 64])
-        dl.load_state_dict(torch.load(dl_path))
+        dl = load_neural_recommender(dl_path)
+        # the .pth has no ids of its own; it was trained on the same map_ids order as the saved MF model
+        candidates = [(user_ids, item_ids)]
+        if os.path.exists(legacy_ids_path):
+            candidates.append(tuple(m.ids for m in load_id_maps(legacy_ids_path)))
+        dl_ids = neural_id_maps(dl, candidates)
     else:
         print("\nTraining Neural Recommender (PyTorch)...")
         dl = NeuralRecommender(n_users, n_items, n_factors=64, hidden_dims=[128, 64])
-        train_model(dl, train, test, epochs=10, batch_size=1024, lr=1e-3, device='cpu')
+        train_fast(dl, train, test, epochs=10, batch_size=1024, lr=1e-3, device='cpu', patience=3, seed=seed)
         torch.save(dl.state_dict(), dl_path)
         print("Saved Neural Recommender model to", dl_path)
+        dl_ids = data_user_map.ids, data_item_map.ids
+    if not os.path.isdir(dl_dir) or os.path.getmtime(dl_path) > os.path.getmtime(dl_dir):
+        if dl_ids is None:
+            print(f"Not exporting {dl_path}: no saved id maps match its "
+                  f"{dl.user_embed.num_embeddings}x{dl.item_embed.num_embeddings} embeddings")
+        else:
+            # the API serves this NumPy export, so it never has to import torch
+            export_numpy(dl, dl_dir, *dl_ids)
+            print("Exported Neural Recommender for serving to", dl_dir)
 
     print('\nDone.')
-    return mf, dl, movies, n_items
+    return mf, dl, movies, user_map, item_map
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run recommender system demo')
     parser.add_argument('--data', type=str, default='data/ratings.csv', help='path to ratings.csv')
     parser.add_argument('--movies', type=str, default='data/movies.csv', help='path to movies.csv')
+    parser.add_argument('--item-index', type=str, default='exact', choices=INDEX_METHODS,
+                        help='how to build the similar-items index ("ivf" is approximate, for large catalogs)')
+    parser.add_argument('--no-ratings-cache', action='store_true', help='always parse the ratings CSV instead of reusing <data>.npz')
+    parser.add_argument('--mf-solver', type=str, default='minibatch', choices=SOLVERS,
+                        help='matrix factorization training engine ("sgd" is the per-rating reference loop, "als" alternating least squares)')
+    parser.add_argument('--batch-users', type=str, default=None,
+                        help='file with one user id per line ("-" for stdin); writes NDJSON recommendations instead of the demo '
+                             '(users outside the model are skipped; POST /recommend/batch folds them in)')
+    parser.add_argument('--out', type=str, default='-', help='NDJSON output path for --batch-users ("-" for stdout)')
+    parser.add_argument('--n', type=int, default=5, help='recommendations per user')
+    parser.add_argument('--genres', type=str, default=None, help='comma-separated genre filter for --batch-users')
+    parser.add_argument('--min-year', type=int, default=None)
+    parser.add_argument('--max-year', type=int, default=None)
+    parser.add_argument('--exclude-watchlist', action='store_true', help='drop movies already in each user\'s watchlist')
+    parser.add_argument('--batch-memory-mb', type=int, default=64, help='max size of each users x items score block')
+    parser.add_argument('--benchmark', action='store_true', help='compare MF and neural recommend latency instead of the demo')
+    parser.add_argument('--check-parity', action='store_true',
+                        help='check the "sgd" solver against the original per-row training loop and the '
+                             '"minibatch" solver\'s test RMSE against "sgd", then exit')
+    parser.add_argument('--dl-threads', type=int, default=None, help='torch intra-op threads for neural inference')
     args = parser.parse_args()
 
-    mf, dl, movies, num_items = main(data_path=args.data, movies_path=args.movies)
+    if args.check_parity:
+        ratings_cache = not args.no_ratings_cache
+        sgd_ok = check_sgd_parity(args.data, ratings_cache=ratings_cache)
+        minibatch_ok = check_minibatch_parity(args.data, ratings_cache=ratings_cache)
+        sys.exit(0 if sgd_ok and minibatch_ok else 1)
 
-    # Example recommendation
-    recommend_top_n(mf, user_id=10, movies=movies, num_items=num_items, n=5)
+    mf, dl, movies, user_map, item_map = main(data_path=args.data, movies_path=args.movies, mf_solver=args.mf_solver,
+                                               ratings_cache=not args.no_ratings_cache, item_index=args.item_index)
+
+    if args.batch_users:
+        src = sys.stdin if args.batch_users == '-' else open(args.batch_users)
+        with src:
+            user_ids = [int(line) for line in src if line.strip()]
+        genres = [g.strip() for g in (args.genres or '').split(',') if g.strip()]
+        out = sys.stdout if args.out == '-' else open(args.out, 'w')
+        with out:
+            recommend_batch(mf, user_ids, movies, out, user_map, item_map, n=args.n, genres=genres, min_year=args.min_year,
+                            max_year=args.max_year, exclude_watchlist=args.exclude_watchlist,
+                            chunk_bytes=args.batch_memory_mb * 2**20)
+    elif args.benchmark:
+        benchmark_recommend({"mf": mf, "dl": NeuralScorer(dl, num_threads=args.dl_threads)}, mf.n_users, n=args.n)
+    else:
+        # Example recommendation
+        recommend_top_n(mf, user_id=10, movies=movies, item_map=item_map, n=5)
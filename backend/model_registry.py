@@ -0,0 +1,176 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+import numpy as np
+from models.artifacts import MANIFEST_NAME, read_manifest
+from models.matrix_factorization import MatrixFactorization, load_artifact
+from models.neural_numpy import load_neural_artifact
+from utils.preprocess import IdMap, load_id_maps
+
+
+class LoadedModel:
+    """A recommender (MF or neural) together with its id maps and the version string reported to clients"""
+
+    def __init__(self, mf, user_map: IdMap, item_map: IdMap, version: str, path: str):
+        self.mf = mf
+        self.user_map = user_map
+        self.item_map = item_map
+        self.version = version
+        self.path = path
+        self.loaded_at = time.time()
+        self._memo: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def cached(self, key: Hashable, compute: Callable[[], object], max_entries: int):
+        """compute(), memoized in a bounded LRU that belongs to this model and is dropped with it"""
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        value = compute()
+        with self._memo_lock:
+            self._memo[key] = value
+            while len(self._memo) > max_entries:
+                self._memo.popitem(last=False)
+        return value
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "n_users": int(self.mf.n_users),
+            "n_items": int(self.mf.n_items),
+            "loaded_at": self.loaded_at,
+        }
+
+
+def _signature(path: str):
+    # the manifest is replaced last when an artifact is published, so its stat marks a new version
+    target = os.path.join(path, MANIFEST_NAME) if os.path.isdir(path) else path
+    st = os.stat(target)
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def load_model(path: str, ids_path: Optional[str] = None, num_threads: Optional[int] = None) -> LoadedModel:
+    """Load an MF or neural artifact directory (memory-mapped), a legacy MF pickle, or a neural .pth state_dict.
+
+    num_threads sets torch's intra-op threads when a .pth is served; None keeps torch's default.
+    """
+    if path.endswith(".pth"):
+        return load_neural_model(path, ids_path, num_threads)
+    user_map = item_map = None
+    if os.path.isdir(path):
+        manifest = read_manifest(path)
+        loader = load_neural_artifact if manifest.get("format") == "NeuralRecommender" else load_artifact
+        mf, user_ids, item_ids = loader(path, mmap_mode="r")
+        version = manifest.get("model_version") or f"unversioned-{_signature(path)[1]}"
+        if user_ids is not None and item_ids is not None:
+            user_map, item_map = IdMap(user_ids), IdMap(item_ids)
+    else:
+        with open(path, "rb") as f:
+            mf = pickle.load(f)
+        version = f"pickle-{_signature(path)[1]}"
+        if ids_path and os.path.exists(ids_path):
+            user_map, item_map = load_id_maps(ids_path)
+    if user_map is None:
+        # models saved without id maps assumed model index == raw id
+        user_map, item_map = IdMap(np.arange(mf.n_users)), IdMap(np.arange(mf.n_items))
+    return LoadedModel(mf, user_map, item_map, version, path)
+
+
+def load_neural_model(path: str, ids_path: Optional[str] = None, num_threads: Optional[int] = None) -> LoadedModel:
+    """Load a NeuralRecommender state_dict wrapped in a NeuralScorer; this imports torch.
+
+    Prefer exporting with models.deep_learning_model.export_numpy, which load_model serves without torch.
+    """
+    from models.deep_learning_model import NeuralScorer, load_neural_recommender
+    scorer = NeuralScorer(load_neural_recommender(path), num_threads=num_threads)
+    user_map = item_map = None
+    if ids_path and os.path.exists(ids_path):
+        user_map, item_map = load_id_maps(ids_path)
+        if (len(user_map), len(item_map)) != (scorer.n_users, scorer.n_items):
+            raise ValueError(f"id maps in {ids_path} do not match the {scorer.n_users}x{scorer.n_items} model in {path}")
+    if user_map is None:
+        user_map, item_map = IdMap(np.arange(scorer.n_users)), IdMap(np.arange(scorer.n_items))
+    return LoadedModel(scorer, user_map, item_map, f"dl-{_signature(path)[1]}", path)
+
+
+def validate(model: LoadedModel) -> None:
+    mf = model.mf
+    if isinstance(mf, MatrixFactorization):
+        if mf.U.shape != (mf.n_users, mf.n_factors) or mf.V.shape != (mf.n_items, mf.n_factors):
+            raise ValueError(f"factor shapes {mf.U.shape}/{mf.V.shape} do not match n_users/n_items/n_factors")
+        weights = [mf.U, mf.V]
+        if mf.item_neighbors is not None and (len(mf.item_neighbors) != mf.n_items or mf.item_neighbors.max(initial=-1) >= mf.n_items):
+            raise ValueError("item similarity index does not match the model's items")
+    else:
+        weights = [np.asarray(w) for w in mf.weights.values()] if hasattr(mf, "weights") else []
+    if len(model.user_map) != mf.n_users or len(model.item_map) != mf.n_items:
+        raise ValueError("id maps do not cover every user/item row of the model")
+    if not all(np.isfinite(w).all() for w in weights):
+        raise ValueError("model weights contain NaN or inf")
+
+
+class ModelRegistry:
+    """Holds the active model and swaps in newly published versions.
+
+    Handlers read `active` once per request and keep using that object, so requests already in
+    flight finish on the model they started with while new requests see the replacement.
+    """
+
+    def __init__(self, path: str, ids_path: Optional[str] = None, num_threads: Optional[int] = None):
+        self.path = path
+        self.ids_path = ids_path
+        self.num_threads = num_threads
+        self.active: Optional[LoadedModel] = None
+        self.last_error: Optional[str] = None
+        self._signature = None
+        self._lock = threading.Lock()  # one reload at a time
+        self._stop = threading.Event()
+
+    def reload(self, force: bool = False) -> Optional[LoadedModel]:
+        """Load, validate and swap in the artifact at `path` if it changed since the last load"""
+        with self._lock:
+            signature = _signature(self.path)
+            if not force and signature == self._signature:
+                return self.active
+            try:
+                model = load_model(self.path, self.ids_path, self.num_threads)
+                validate(model)
+            except Exception as exc:
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                raise
+            self.active = model
+            self._signature = signature
+            self.last_error = None
+            return model
+
+    def watch(self, interval: float) -> threading.Thread:
+        """Poll the artifact in a daemon thread and reload it whenever a new version is published"""
+        def run():
+            reported = None
+            while not self._stop.wait(interval):
+                try:
+                    previous = self.active
+                    model = self.reload()
+                    if model is not previous:
+                        print(f"[registry] Loaded model {model.version} from {self.path}")
+                except FileNotFoundError:
+                    pass  # artifact not published (yet), or mid-replacement
+                except Exception as exc:
+                    # a broken artifact is retried every poll; report it once
+                    if str(exc) != reported:
+                        print(f"[registry] Keeping {self.active.version if self.active else 'no model'}: {exc}")
+                    reported = str(exc)
+                else:
+                    reported = None
+
+        thread = threading.Thread(target=run, name="model-registry-watch", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,64 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+# Shared on-disk layout for model artifacts: one .npy per array plus manifest.json
+MANIFEST_NAME = "manifest.json"
+
+
+def write_artifact(path, arrays, manifest, model_version=None):
+    """Write `arrays` as .npy files and `manifest` (plus files and model_version) as manifest.json.
+
+    Array files are named after their content (<name>-<sha256 prefix>.npy) and never overwritten, so
+    every manifest only refers to files that cannot change under it: a loader reading the manifest
+    during a publish gets either the old set or the new one, never a mix. The manifest is renamed into
+    place last; files referenced by neither it nor the previous manifest are then removed (processes
+    that have them memory-mapped keep reading them). Returns the model_version, which defaults to a
+    UTC timestamp plus a digest of the arrays.
+    """
+    os.makedirs(path, exist_ok=True)
+    try:
+        previous = set(read_manifest(path).get("files", {}).values())
+    except (OSError, ValueError):
+        previous = set()
+    files = {}
+    digest = hashlib.sha256()
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        digest.update(array.data)
+        files[name] = f"{name}-{hashlib.sha256(array.data).hexdigest()[:16]}.npy"
+        target = os.path.join(path, files[name])
+        if os.path.exists(target):
+            continue  # same content already published, e.g. U and V when only the item index is rebuilt
+        tmp = os.path.join(path, f".{files[name]}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, target)
+    if model_version is None:
+        model_version = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + digest.hexdigest()[:8]
+    manifest = dict(manifest, model_version=model_version, files=files)
+    tmp = os.path.join(path, f".{MANIFEST_NAME}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(path, MANIFEST_NAME))
+    keep = previous | set(files.values())
+    for fname in os.listdir(path):
+        if fname.endswith(".npy") and fname not in keep:
+            os.remove(os.path.join(path, fname))
+    return model_version
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def load_arrays(path, manifest, fmt, version, mmap_mode="r"):
+    """Check the manifest's format/version and load every listed array"""
+    if manifest.get("format") != fmt or manifest.get("version") != version:
+        raise ValueError(f"unsupported model artifact in {path}: "
+                         f"{manifest.get('format')!r} version {manifest.get('version')!r}")
+    return {name: np.load(os.path.join(path, fname), mmap_mode=mmap_mode)
+            for name, fname in manifest["files"].items()}
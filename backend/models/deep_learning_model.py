@@ -1,7 +1,9 @@
+import time
 import torch
 import torch.nn as nn
 from sklearn.metrics import mean_squared_error
 import numpy as np
+from models.ranking import TopNRecommender
 
 class NeuralRecommender(nn.Module):
     def __init__(self, n_users, n_items, n_factors=32, hidden_dims=[128,64]):
@@ -23,6 +25,69 @@ class NeuralRecommender(nn.Module):
         x = torch.cat([u, i], dim=1)
         return self.net(x).squeeze(1)
 
+def load_neural_recommender(path, map_location="cpu"):
+    """Rebuild a NeuralRecommender from a saved state_dict, reading its sizes off the weight shapes"""
+    state = torch.load(path, map_location=map_location)
+    n_users, n_factors = state["user_embed.weight"].shape
+    n_items = state["item_embed.weight"].shape[0]
+    linear = sorted(int(k.split(".")[1]) for k in state if k.startswith("net.") and k.endswith(".weight"))
+    hidden_dims = [state[f"net.{i}.weight"].shape[0] for i in linear[:-1]]
+    model = NeuralRecommender(n_users, n_items, n_factors=n_factors, hidden_dims=hidden_dims)
+    model.load_state_dict(state)
+    return model
+
+
+class NeuralScorer(TopNRecommender):
+    """Batched CPU inference for a trained NeuralRecommender, with the same recommend API as MF.
+
+    The first layer sees concat(user, item), so it splits into a user part and an item part. The
+    item part (plus bias) is computed once for every item; each request only projects its users and
+    broadcasts them across chunks of items before running the remaining layers.
+    """
+
+    def __init__(self, model, num_threads=None, chunk_pairs=1 << 16):
+        if num_threads:
+            torch.set_num_threads(num_threads)  # process-wide
+        self.model = model.eval()
+        self.n_users = model.user_embed.num_embeddings
+        self.n_items = model.item_embed.num_embeddings
+        self.chunk_pairs = chunk_pairs
+        k = model.user_embed.embedding_dim
+        first = model.net[0]
+        with torch.inference_mode():
+            self._user_weight = first.weight[:, :k].T.contiguous()
+            self._item_hidden = model.item_embed.weight @ first.weight[:, k:].T + first.bias
+        self._tail = model.net[1:]
+
+    def _score_row_bytes(self):
+        return self.n_items * 4
+
+    def score_users(self, user_idxs):
+        users = torch.as_tensor(np.asarray(user_idxs, dtype=np.int64))
+        scores = np.empty((len(users), self.n_items), dtype=np.float32)
+        chunk = max(1, self.chunk_pairs // max(1, len(users)))
+        with torch.inference_mode():
+            user_hidden = self.model.user_embed(users) @ self._user_weight
+            for start in range(0, self.n_items, chunk):
+                hidden = user_hidden[:, None, :] + self._item_hidden[None, start:start + chunk]
+                scores[:, start:start + chunk] = self._tail(hidden).squeeze(-1).numpy()
+        return scores
+
+
+def export_numpy(model, path, user_ids=None, item_ids=None, model_version=None):
+    """Write the embeddings and MLP weights as a NumPy artifact servable by models.neural_numpy without torch"""
+    from models.neural_numpy import save_neural_artifact
+    weights = {
+        "user_embed": model.user_embed.weight.detach().cpu().numpy(),
+        "item_embed": model.item_embed.weight.detach().cpu().numpy(),
+    }
+    linears = [layer for layer in model.net if isinstance(layer, nn.Linear)]
+    for j, layer in enumerate(linears):
+        weights[f"layer{j}_weight"] = layer.weight.detach().cpu().numpy()
+        weights[f"layer{j}_bias"] = layer.bias.detach().cpu().numpy()
+    return save_neural_artifact(weights, path, user_ids, item_ids, model_version)
+
+
 def train_model(model, train_df, test_df=None, epochs=5, batch_size=1024, lr=1e-3, device='cpu'):
     model.to(device)
     optimizer = torch.optim.Adam(model.parameters(), lr=lr)
@@ -56,3 +121,70 @@ def train_model(model, train_df, test_df=None, epochs=5, batch_size=1024, lr=1e-
         else:
             print(f"[DL] Epoch {epoch}/{epochs} - TrainLoss: {avg_loss:.4f}")
     return model
+
+
+def evaluate_rmse(model, users, items, ratings, batch_size=65536):
+    """RMSE over pre-built tensors, scored in fixed-size chunks so memory stays bounded"""
+    model.eval()
+    squared_error = 0.0
+    with torch.inference_mode():
+        for start in range(0, len(ratings), batch_size):
+            end = start + batch_size
+            squared_error += float(((model(users[start:end], items[start:end]) - ratings[start:end]) ** 2).sum())
+    return (squared_error / max(1, len(ratings))) ** 0.5
+
+
+def _as_tensors(df, device):
+    return (torch.tensor(df.user.to_numpy(dtype=np.int64), device=device),
+            torch.tensor(df.item.to_numpy(dtype=np.int64), device=device),
+            torch.tensor(df.rating.to_numpy(dtype=np.float32), device=device))
+
+
+def train_fast(model, train_df, test_df=None, epochs=5, batch_size=1024, lr=1e-3, device='cpu', eval_batch_size=65536,
+               patience=None, checkpoint_path=None, seed=None):
+    """Same objective as train_model, but batches are slices of a shuffled index over pre-built tensors.
+
+    With a test set, the epoch with the lowest test RMSE is kept (and saved to checkpoint_path, if
+    given) and restored at the end; training stops after `patience` epochs without improvement.
+    """
+    model.to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    criterion = nn.MSELoss()
+    generator = torch.Generator().manual_seed(seed) if seed is not None else None
+    users, items, ratings = _as_tensors(train_df, device)
+    test = _as_tensors(test_df, device) if test_df is not None and len(test_df) > 0 else None
+    n = len(ratings)
+    best_rmse, best_epoch, best_state, stale = float("inf"), None, None, 0
+    for epoch in range(1, epochs+1):
+        model.train()
+        start = time.perf_counter()
+        order = torch.randperm(n, generator=generator).to(device)
+        total_loss = torch.zeros((), device=device)  # summed on device; one sync per epoch
+        for begin in range(0, n, batch_size):
+            idx = order[begin:begin + batch_size]
+            optimizer.zero_grad(set_to_none=True)
+            loss = criterion(model(users[idx], items[idx]), ratings[idx])
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.detach() * len(idx)
+        avg_loss = float(total_loss) / n
+        rate = n / (time.perf_counter() - start)
+        if test is None:
+            print(f"[DL] Epoch {epoch}/{epochs} - TrainLoss: {avg_loss:.4f} - {rate:,.0f} samples/s")
+            continue
+        rmse = evaluate_rmse(model, *test, batch_size=eval_batch_size)
+        print(f"[DL] Epoch {epoch}/{epochs} - TrainLoss: {avg_loss:.4f} - TestRMSE: {rmse:.4f} - {rate:,.0f} samples/s")
+        if rmse < best_rmse:
+            best_rmse, best_epoch, stale = rmse, epoch, 0
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+            if checkpoint_path:
+                torch.save(best_state, checkpoint_path)
+        else:
+            stale += 1
+            if patience and stale >= patience:
+                print(f"[DL] No improvement for {patience} epochs, stopping")
+                break
+    if best_state is not None:
+        model.load_state_dict(best_state)
+        print(f"[DL] Restored epoch {best_epoch} (TestRMSE: {best_rmse:.4f})")
+    return model
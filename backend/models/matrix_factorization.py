@@ -1,8 +1,46 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import scipy.sparse as sp
 from sklearn.metrics import mean_squared_error
+from models.ranking import TopNRecommender
+from models.artifacts import write_artifact, read_manifest, load_arrays
+from models.similarity import build_item_neighbors
 
-class MatrixFactorization:
-    def __init__(self, n_users, n_items, n_factors=20, lr=0.01, reg=0.0, epochs=10, verbose=True):
+# "sgd" is the original per-rating update loop, kept as the reference for parity checks;
+# "minibatch" runs shuffled vectorized batches over contiguous arrays;
+# "als" alternates batched regularized least-squares solves for all users, then all items.
+SOLVERS = ("sgd", "minibatch", "als")
+
+# On-disk layout (see models.artifacts); bump when the layout changes incompatibly
+ARTIFACT_VERSION = 1
+# ALS solves at most ALS_BATCH_ROWS rows per np.linalg.solve call. Gram matrices of rows with up to
+# ALS_PAD_MAX ratings are built as stacked matmuls over padded (rows, ratings, k) blocks of at most
+# ALS_GRAM_BYTES; busier rows are few and big enough for one BLAS product each.
+ALS_BATCH_ROWS = 4096
+ALS_PAD_MAX = 256
+ALS_GRAM_BYTES = 64 * 2**20
+HYPERPARAMETERS = ("n_factors", "lr", "reg", "epochs", "solver", "batch_size", "seed", "n_jobs")
+
+
+def _as_arrays(df):
+    users = np.ascontiguousarray(df["user"].to_numpy(dtype=np.int64))
+    items = np.ascontiguousarray(df["item"].to_numpy(dtype=np.int64))
+    ratings = np.ascontiguousarray(df["rating"].to_numpy(dtype=np.float64))
+    return users, items, ratings
+
+
+def _ratings_csr(users, items, ratings, n_users, n_items):
+    return sp.csr_matrix((ratings, (users, items)), shape=(n_users, n_items))
+
+
+class MatrixFactorization(TopNRecommender):
+    def __init__(self, n_users, n_items, n_factors=20, lr=0.01, reg=0.0, epochs=10, verbose=True,
+                 solver="sgd", batch_size=1024, seed=None, n_jobs=None):
+        if solver not in SOLVERS:
+            raise ValueError(f"solver must be one of {SOLVERS}, got {solver!r}")
+        if solver == "als" and reg <= 0:
+            raise ValueError("the als solver needs reg > 0 to keep the normal equations well-posed")
         self.n_users = n_users
         self.n_items = n_items
         self.n_factors = n_factors
@@ -10,28 +48,211 @@ class MatrixFactorization:
         self.reg = reg
         self.epochs = epochs
         self.verbose = verbose
-        self.U = np.random.normal(scale=0.1, size=(n_users, n_factors))
-        self.V = np.random.normal(scale=0.1, size=(n_items, n_factors))
+        self.solver = solver
+        self.batch_size = batch_size
+        self.seed = seed
+        self.n_jobs = n_jobs
+        rng = np.random.default_rng(seed)
+        self.U = rng.normal(scale=0.1, size=(n_users, n_factors))
+        self.V = rng.normal(scale=0.1, size=(n_items, n_factors))
+        # (n_items, k) most similar items by cosine over V, from build_item_index()
+        self.item_neighbors = None
+        self.item_neighbor_scores = None
+
+    def __setstate__(self, state):
+        # models pickled before the solver options existed
+        state.setdefault("solver", "sgd")
+        state.setdefault("batch_size", 1024)
+        state.setdefault("seed", None)
+        state.setdefault("n_jobs", None)
+        state.setdefault("item_neighbors", None)
+        state.setdefault("item_neighbor_scores", None)
+        self.__dict__.update(state)
 
     def train(self, train_df, test_df=None):
+        users, items, ratings = _as_arrays(train_df)
+        test = _as_arrays(test_df) if test_df is not None and len(test_df) > 0 else None
+        if self.solver == "als":
+            return self._train_als(users, items, ratings, test)
+        rng = np.random.default_rng(self.seed)
         for epoch in range(1, self.epochs + 1):
-            # SGD over training examples
-            for _, row in train_df.iterrows():
-                u = int(row["user"])
-                i = int(row["item"])
-                r = float(row["rating"])
-                pred = np.dot(self.U[u], self.V[i])
-                err = r - pred
-                # gradients with optional L2 regularization
-                self.U[u] += self.lr * (err * self.V[i] - self.reg * self.U[u])
-                self.V[i] += self.lr * (err * self.U[u] - self.reg * self.V[i])
-            if test_df is not None and len(test_df) > 0:
-                preds = [np.dot(self.U[int(r["user"])], self.V[int(r["item"])]) for _, r in test_df.iterrows()]
-                mse = mean_squared_error(test_df["rating"], preds)
-                rmse = float(mse) ** 0.5
+            if self.solver == "sgd":
+                self._sgd_epoch(users, items, ratings)
+            else:
+                self._minibatch_epoch(users, items, ratings, rng)
+            if test is not None:
+                rmse = self.rmse(*test)
                 if self.verbose:
                     print(f"[MF] Epoch {epoch}/{self.epochs} - RMSE: {rmse:.4f}")
         return self
 
+    def _sgd_epoch(self, users, items, ratings):
+        # SGD over training examples, one rating at a time
+        for u, i, r in zip(users.tolist(), items.tolist(), ratings.tolist()):
+            pred = np.dot(self.U[u], self.V[i])
+            err = r - pred
+            # gradients with optional L2 regularization
+            self.U[u] += self.lr * (err * self.V[i] - self.reg * self.U[u])
+            self.V[i] += self.lr * (err * self.U[u] - self.reg * self.V[i])
+
+    def _minibatch_epoch(self, users, items, ratings, rng):
+        order = rng.permutation(len(ratings))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            u = users[batch]
+            i = items[batch]
+            Uu = self.U[u]
+            Vi = self.V[i]
+            err = ratings[batch] - np.einsum("ij,ij->i", Uu, Vi)
+            # scatter-add so users/items repeated within a batch accumulate every update
+            np.add.at(self.U, u, self.lr * (err[:, None] * Vi - self.reg * Uu))
+            np.add.at(self.V, i, self.lr * (err[:, None] * Uu - self.reg * Vi))
+
+    def _train_als(self, users, items, ratings, test):
+        R = _ratings_csr(users, items, ratings, self.n_users, self.n_items)
+        Rt = R.T.tocsr()
+        n_jobs = self.n_jobs or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            for sweep in range(1, self.epochs + 1):
+                self._als_half_sweep(self.U, self.V, R, pool, n_jobs)
+                self._als_half_sweep(self.V, self.U, Rt, pool, n_jobs)
+                if test is not None:
+                    rmse = self.rmse(*test)
+                    if self.verbose:
+                        print(f"[MF] ALS sweep {sweep}/{self.epochs} - RMSE: {rmse:.4f}")
+        return self
+
+    def _als_half_sweep(self, X, Y, R, pool, n_jobs):
+        # rows of X are independent given Y, so split them into one block per worker
+        blocks = np.array_split(np.arange(R.shape[0]), n_jobs)
+        for _ in pool.map(lambda rows: self._als_solve_rows(X, Y, R, rows), blocks):
+            pass
+
+    def _als_solve_rows(self, X, Y, R, rows):
+        for start in range(0, len(rows), ALS_BATCH_ROWS):
+            self._als_solve_batch(X, Y, R, rows[start:start + ALS_BATCH_ROWS])
+
+    def _als_solve_batch(self, X, Y, R, rows):
+        if len(rows) == 0:
+            return
+        k = self.n_factors
+        lo, hi = int(rows[0]), int(rows[-1]) + 1  # blocks come from np.array_split, so rows are contiguous
+        indptr = R.indptr[lo:hi + 1]
+        counts = np.diff(indptr)
+        A = np.zeros((hi - lo, k, k))
+        b = np.zeros((hi - lo, k))
+        for j in np.flatnonzero(counts > ALS_PAD_MAX).tolist():
+            start, stop = indptr[j], indptr[j + 1]
+            Yr = Y[R.indices[start:stop]]
+            A[j] = Yr.T @ Yr
+            b[j] = Yr.T @ R.data[start:stop]
+        # rows with 2^(p-1) < count <= 2^p are padded to 2^p ratings and handled as one stacked matmul
+        width = 1
+        while width <= ALS_PAD_MAX:
+            in_bucket = np.flatnonzero((counts > width // 2) & (counts <= width))
+            per_chunk = max(1, ALS_GRAM_BYTES // (width * k * 8))
+            for chunk_start in range(0, len(in_bucket), per_chunk):
+                chunk = in_bucket[chunk_start:chunk_start + per_chunk]
+                valid = np.arange(width) < counts[chunk, None]
+                pos = np.where(valid, indptr[chunk, None] + np.arange(width), 0)
+                Yr = Y[R.indices[pos]] * valid[..., None]
+                YrT = Yr.transpose(0, 2, 1)
+                A[chunk] = YrT @ Yr
+                b[chunk] = (YrT @ np.where(valid, R.data[pos], 0.0)[..., None])[..., 0]
+            width *= 2
+        A += self.reg * np.eye(k)
+        X[lo:hi] = np.linalg.solve(A, b[..., None])[..., 0]
+
     def predict(self, user_idx, item_idx):
         return float(np.dot(self.U[user_idx], self.V[item_idx]))
+
+    def predict_many(self, users, items):
+        return np.einsum("ij,ij->i", self.U[users], self.V[items])
+
+    def score_users(self, user_idxs):
+        return self.U[user_idxs] @ self.V.T
+
+    def _score_row_bytes(self):
+        return self.n_items * self.V.itemsize
+
+    def score_vectors(self, user_vectors):
+        """Scores for user vectors that are not rows of U, e.g. from fold_in()"""
+        return np.atleast_2d(user_vectors) @ self.V.T
+
+    def fold_in(self, item_idxs, ratings, weights=None, reg=1.0):
+        """User vector for someone outside U, fitted to their ratings with V held fixed.
+
+        Solves the weighted ridge problem min_u sum_i w_i (r_i - V_i.u)^2 + reg |u|^2, a k x k system,
+        so it takes microseconds and needs no retraining.
+        """
+        item_idxs = np.asarray(item_idxs, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        weights = np.ones(len(item_idxs)) if weights is None else np.asarray(weights, dtype=np.float64)
+        Vi = self.V[item_idxs]
+        A = (Vi * weights[:, None]).T @ Vi + reg * np.eye(self.n_factors)
+        b = Vi.T @ (weights * ratings)
+        return np.linalg.solve(A, b)
+
+    def build_item_index(self, k=50, method="exact", **kwargs):
+        """Precompute each item's k nearest items (see models.similarity.build_item_neighbors)"""
+        self.item_neighbors, self.item_neighbor_scores = build_item_neighbors(self.V, k=k, method=method, **kwargs)
+        return self
+
+    def similar_items(self, item_idx, n, allowed_mask=None):
+        """Up to n (item_indices, cosine similarities) most like item_idx, best first; needs build_item_index().
+
+        allowed_mask is a boolean array over items; only the index's k neighbors are considered.
+        """
+        n = max(int(n), 0)  # a negative n would slice from the end and return k-|n| neighbors
+        neighbors = self.item_neighbors[item_idx]
+        keep = neighbors >= 0
+        if allowed_mask is not None:
+            keep[keep] = np.asarray(allowed_mask, dtype=bool)[neighbors[keep]]
+        return neighbors[keep][:n], self.item_neighbor_scores[item_idx][keep][:n]
+
+    def rmse(self, users, items, ratings):
+        return float(mean_squared_error(ratings, self.predict_many(users, items))) ** 0.5
+
+
+def save_artifact(model, path, user_ids=None, item_ids=None, model_version=None):
+    """Write model factors (and optional raw id arrays, position == index) as .npy files plus a manifest.
+
+    Array files are content-addressed and the manifest is switched last (see models.artifacts.write_artifact),
+    so loaders never mix files from two saves. Returns the model_version.
+    """
+    arrays = {"U": model.U, "V": model.V}
+    if user_ids is not None:
+        arrays["user_ids"] = np.asarray(user_ids, dtype=np.int64)
+    if item_ids is not None:
+        arrays["item_ids"] = np.asarray(item_ids, dtype=np.int64)
+    if getattr(model, "item_neighbors", None) is not None:
+        arrays["item_neighbors"] = model.item_neighbors
+        arrays["item_neighbor_scores"] = model.item_neighbor_scores
+    manifest = {
+        "format": "MatrixFactorization",
+        "version": ARTIFACT_VERSION,
+        "n_users": int(model.n_users),
+        "n_items": int(model.n_items),
+        "dtype": str(model.U.dtype),
+        "hyperparameters": {name: getattr(model, name) for name in HYPERPARAMETERS},
+    }
+    return write_artifact(path, arrays, manifest, model_version)
+
+
+def load_artifact(path, mmap_mode="r"):
+    """Load a save_artifact() directory as (model, user_ids, item_ids); id arrays are None if not saved.
+
+    With the default mmap_mode="r" the arrays are read-only views of the files, so processes serving
+    the same artifact share its pages; pass mmap_mode=None to get writable in-memory copies for training.
+    """
+    manifest = read_manifest(path)
+    arrays = load_arrays(path, manifest, "MatrixFactorization", ARTIFACT_VERSION, mmap_mode)
+    U, V = arrays["U"], arrays["V"]
+    if U.shape != (manifest["n_users"], manifest["hyperparameters"]["n_factors"]) or V.shape[0] != manifest["n_items"]:
+        raise ValueError(f"factor shapes {U.shape}/{V.shape} do not match the manifest in {path}")
+    model = MatrixFactorization.__new__(MatrixFactorization)
+    model.__setstate__(dict(manifest["hyperparameters"], n_users=manifest["n_users"], n_items=manifest["n_items"],
+                            verbose=False, U=U, V=V))
+    model.item_neighbors = arrays.get("item_neighbors")
+    model.item_neighbor_scores = arrays.get("item_neighbor_scores")
+    return model, arrays.get("user_ids"), arrays.get("item_ids")
@@ -0,0 +1,88 @@
+import numpy as np
+from models.ranking import TopNRecommender
+from models.artifacts import write_artifact, read_manifest, load_arrays
+
+# NeuralRecommender exported for serving without torch; bump when the layout changes incompatibly
+NEURAL_ARTIFACT_VERSION = 1
+
+
+def _layer_names(n_layers):
+    return [(f"layer{j}_weight", f"layer{j}_bias") for j in range(n_layers)]
+
+
+def save_neural_artifact(weights, path, user_ids=None, item_ids=None, model_version=None):
+    """Write exported NeuralRecommender weights as a models.artifacts directory.
+
+    `weights` maps "user_embed", "item_embed" and ("layer{j}_weight", "layer{j}_bias") for each
+    Linear layer, in order, to NumPy arrays; every layer but the last is followed by a ReLU.
+    """
+    n_users, n_factors = weights["user_embed"].shape
+    n_items = weights["item_embed"].shape[0]
+    n_layers = sum(1 for name in weights if name.endswith("_weight") and name.startswith("layer"))
+    arrays = {"user_embed": weights["user_embed"], "item_embed": weights["item_embed"]}
+    for w, b in _layer_names(n_layers):
+        arrays[w], arrays[b] = weights[w], weights[b]
+    if user_ids is not None:
+        arrays["user_ids"] = np.asarray(user_ids, dtype=np.int64)
+    if item_ids is not None:
+        arrays["item_ids"] = np.asarray(item_ids, dtype=np.int64)
+    manifest = {
+        "format": "NeuralRecommender",
+        "version": NEURAL_ARTIFACT_VERSION,
+        "n_users": int(n_users),
+        "n_items": int(n_items),
+        "n_factors": int(n_factors),
+        "hidden_dims": [int(weights[w].shape[0]) for w, _ in _layer_names(n_layers)[:-1]],
+        "activation": "relu",
+        "dtype": str(weights["user_embed"].dtype),
+    }
+    return write_artifact(path, arrays, manifest, model_version)
+
+
+class NumpyNeuralScorer(TopNRecommender):
+    """Pure-NumPy forward pass of an exported NeuralRecommender, scored like NeuralScorer.
+
+    The first layer's item half (plus bias) is precomputed for every item; each call projects its
+    users once and broadcasts them across chunks of items through the remaining layers.
+    """
+
+    def __init__(self, weights, n_layers, chunk_pairs=1 << 16):
+        self.weights = weights
+        self.user_embed = weights["user_embed"]
+        self.n_users, k = self.user_embed.shape
+        self.n_items = weights["item_embed"].shape[0]
+        self.chunk_pairs = chunk_pairs
+        layers = [(weights[w], weights[b]) for w, b in _layer_names(n_layers)]
+        first_w, first_b = layers[0]
+        self._user_weight = np.ascontiguousarray(first_w[:, :k].T)
+        self._item_hidden = np.asarray(weights["item_embed"]) @ first_w[:, k:].T + first_b
+        self._tail = [(np.ascontiguousarray(w.T), np.asarray(b)) for w, b in layers[1:]]
+
+    def _score_row_bytes(self):
+        return self.n_items * self._item_hidden.itemsize
+
+    def score_users(self, user_idxs):
+        users = np.asarray(user_idxs, dtype=np.int64)
+        scores = np.empty((len(users), self.n_items), dtype=self._item_hidden.dtype)
+        user_hidden = self.user_embed[users] @ self._user_weight
+        chunk = max(1, self.chunk_pairs // max(1, len(users)))
+        for start in range(0, self.n_items, chunk):
+            hidden = user_hidden[:, None, :] + self._item_hidden[None, start:start + chunk]
+            shape = hidden.shape[:2]
+            hidden = hidden.reshape(-1, hidden.shape[-1])
+            for w, b in self._tail:
+                np.maximum(hidden, 0, out=hidden)
+                hidden = hidden @ w + b
+            scores[:, start:start + chunk] = hidden.reshape(shape)
+        return scores
+
+
+def load_neural_artifact(path, mmap_mode="r"):
+    """Load a save_neural_artifact() directory as (scorer, user_ids, item_ids); id arrays are None if not saved"""
+    manifest = read_manifest(path)
+    arrays = load_arrays(path, manifest, "NeuralRecommender", NEURAL_ARTIFACT_VERSION, mmap_mode)
+    if arrays["user_embed"].shape != (manifest["n_users"], manifest["n_factors"]) \
+            or arrays["item_embed"].shape[0] != manifest["n_items"]:
+        raise ValueError(f"embedding shapes do not match the manifest in {path}")
+    user_ids, item_ids = arrays.pop("user_ids", None), arrays.pop("item_ids", None)
+    return NumpyNeuralScorer(arrays, len(manifest["hidden_dims"]) + 1), user_ids, item_ids
@@ -0,0 +1,74 @@
+from abc import ABC, abstractmethod
+import numpy as np
+
+
+class TopNRecommender(ABC):
+    """Top-n ranking shared by the recommenders.
+
+    Subclasses provide `n_items` and `score_users(user_idxs)`, returning a float
+    (len(user_idxs), n_items) array of scores.
+    """
+
+    @abstractmethod
+    def score_users(self, user_idxs):
+        ...
+
+    def _score_row_bytes(self):
+        # memory for one user's row of scores, used to size recommend_many chunks
+        return self.n_items * 8
+
+    def recommend(self, user_idx, n, allowed_mask=None, exclude=None):
+        """Top-n items for one user as (item_indices, scores), best first.
+
+        allowed_mask is a boolean array over items; exclude is an iterable of item indices.
+        """
+        return self.rank_scores(self.score_users([user_idx]), n, allowed_mask, exclude)
+
+    def rank_scores(self, scores, n, allowed_mask=None, exclude=None):
+        """recommend() for a precomputed (1, n_items) score row; scores is modified in place"""
+        if allowed_mask is not None:
+            scores[:, ~np.asarray(allowed_mask, dtype=bool)] = -np.inf
+        if exclude is not None:
+            self._mask_excluded(scores[0], exclude)
+        top, top_scores = self._top_n_rows(scores, n)
+        keep = np.isfinite(top_scores[0])
+        return top[0][keep], top_scores[0][keep]
+
+    def recommend_many(self, user_idxs, n, allowed_mask=None, exclude=None, chunk_bytes=64 * 2**20):
+        """Yield (user_idx, item_indices, scores) for each user, in input order.
+
+        Users are scored in chunks whose score block is no larger than chunk_bytes.
+        exclude maps a user index to an iterable of item indices to drop for that user.
+        """
+        user_idxs = np.asarray(user_idxs, dtype=np.int64)
+        blocked = None if allowed_mask is None else ~np.asarray(allowed_mask, dtype=bool)
+        rows_per_chunk = max(1, int(chunk_bytes) // self._score_row_bytes())
+        for start in range(0, len(user_idxs), rows_per_chunk):
+            chunk = user_idxs[start:start + rows_per_chunk].tolist()
+            scores = self.score_users(chunk)
+            if blocked is not None:
+                scores[:, blocked] = -np.inf
+            if exclude:
+                for row, u in enumerate(chunk):
+                    excluded = exclude.get(u)
+                    if excluded is not None and len(excluded):
+                        self._mask_excluded(scores[row], excluded)
+            top, top_scores = self._top_n_rows(scores, n)
+            for row, u in enumerate(chunk):
+                keep = np.isfinite(top_scores[row])
+                yield u, top[row][keep], top_scores[row][keep]
+
+    def _mask_excluded(self, scores, exclude):
+        excluded = np.fromiter(exclude, dtype=np.int64) if not isinstance(exclude, np.ndarray) else exclude.astype(np.int64, copy=False)
+        scores[excluded[(excluded >= 0) & (excluded < self.n_items)]] = -np.inf
+
+    @staticmethod
+    def _top_n_rows(scores, n):
+        n = min(int(n), scores.shape[1])
+        if n <= 0:
+            empty = np.empty((scores.shape[0], 0), dtype=np.int64)
+            return empty, empty.astype(scores.dtype)
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
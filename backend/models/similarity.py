@@ -0,0 +1,87 @@
+import numpy as np
+
+# "exact" ranks every item against every other in blocked matrix multiplies;
+# "ivf" clusters items into lists and only ranks each item against the lists closest to its own.
+INDEX_METHODS = ("exact", "ivf")
+
+
+def _normalize(V):
+    V = np.asarray(V, dtype=np.float32)
+    norms = np.linalg.norm(V, axis=1, keepdims=True)
+    return V / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, k):
+    # best-first top k of each row; rows are candidates, columns items
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def _exact(Vn, k, block_size):
+    n = len(Vn)
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores = np.full((n, k), -np.inf, dtype=np.float32)
+    width = min(k, n - 1)
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(start + block_size, n))
+        sims = Vn[rows] @ Vn.T
+        sims[np.arange(len(rows)), rows] = -np.inf  # an item is not its own neighbor
+        top, top_scores = _top_k(sims, width)
+        neighbors[rows, :width] = top
+        scores[rows, :width] = top_scores
+    return neighbors, scores
+
+
+def _assign(Vn, centroids, block_size):
+    return np.concatenate([np.argmax(Vn[start:start + block_size] @ centroids.T, axis=1)
+                           for start in range(0, len(Vn), block_size)])
+
+
+def _ivf(Vn, k, n_lists, n_probe, block_size, seed, n_iter=5):
+    n = len(Vn)
+    rng = np.random.default_rng(seed)
+    # spherical k-means coarse quantizer
+    centroids = Vn[rng.choice(n, size=n_lists, replace=False)]
+    for _ in range(n_iter):
+        assign = _assign(Vn, centroids, block_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, Vn)
+        filled = np.linalg.norm(sums, axis=1) > 0
+        centroids[filled] = _normalize(sums[filled])
+    assign = _assign(Vn, centroids, block_size)
+    members = np.split(np.argsort(assign, kind="stable"), np.cumsum(np.bincount(assign, minlength=n_lists))[:-1])
+    # every item in a list is compared with the items of that list's n_probe closest lists (itself included)
+    probes = np.argsort(-(centroids @ centroids.T), axis=1, kind="stable")[:, :n_probe]
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores = np.full((n, k), -np.inf, dtype=np.float32)
+    for lst in range(n_lists):
+        rows = members[lst]
+        if len(rows) == 0:
+            continue
+        cols = np.concatenate([members[p] for p in probes[lst]])
+        sims = Vn[rows] @ Vn[cols].T
+        sims[cols[None, :] == rows[:, None]] = -np.inf
+        width = min(k, len(cols))
+        top, top_scores = _top_k(sims, width)
+        neighbors[rows, :width] = cols[top]
+        scores[rows, :width] = top_scores
+    neighbors[~np.isfinite(scores)] = -1
+    return neighbors, scores
+
+
+def build_item_neighbors(V, k=50, method="exact", block_size=1024, n_lists=None, n_probe=8, seed=0):
+    """Top-k most cosine-similar items for every row of V as (neighbors int32, scores float32), best first.
+
+    Rows with fewer than k candidates are padded with -1 / -inf. For "ivf", n_lists defaults to
+    about sqrt(n_items); raising n_probe trades build time for recall.
+    """
+    if method not in INDEX_METHODS:
+        raise ValueError(f"method must be one of {INDEX_METHODS}, got {method!r}")
+    Vn = _normalize(V)
+    if method == "exact" or len(Vn) < 2:
+        return _exact(Vn, k, block_size)
+    n_lists = min(len(Vn), n_lists or max(1, int(np.sqrt(len(Vn)))))
+    return _ivf(Vn, k, n_lists, min(n_probe, n_lists), block_size, seed)
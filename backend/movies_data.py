@@ -1,3 +1,7 @@
+import hashlib
+import json
+import numpy as np
+
 # Hardcoded real movie data with TMDB poster paths
 MOVIES = [
     {
@@ -506,14 +510,88 @@ MOVIES = [
     }
 ]
 
+class MovieCatalog:
+    """Movie records plus a movie_id -> row index and columnar arrays for vectorized filtering"""
+
+    def __init__(self, movies):
+        self.movies = list(movies)
+        self.ids = np.array([m["movie_id"] for m in self.movies], dtype=np.int64)
+        # 0 / NaN mark a missing year / rating
+        self.years = np.array([int(m.get("year") or 0) for m in self.movies], dtype=np.int32)
+        self.ratings = np.array([m.get("rating") or np.nan for m in self.movies], dtype=np.float32)
+        self._row = {}
+        for row, movie_id in enumerate(self.ids.tolist()):
+            self._row.setdefault(movie_id, row)
+
+        genre_sets = [{g.strip() for g in m.get("genres") or [] if g and g.strip()} for m in self.movies]
+        self.genres = sorted(set().union(*genre_sets))
+        self.genre_codes = {genre: code for code, genre in enumerate(self.genres)}
+        # genre_matrix[row, code] is True when the movie has that genre
+        self.genre_matrix = np.zeros((len(self.movies), len(self.genres)), dtype=bool)
+        for row, movie_genres in enumerate(genre_sets):
+            self.genre_matrix[row, [self.genre_codes[g] for g in movie_genres]] = True
+
+        # movies without a year never match a year filter, so they are left out of the sorted arrays
+        dated = np.flatnonzero(self.years > 0)
+        order = np.argsort(self.years[dated], kind="stable")
+        self._year_order = dated[order]
+        self._sorted_years = self.years[self._year_order]
+        self.all_years = np.unique(self._sorted_years).tolist()
+
+        # /survey/schema only changes with the catalog, so serialize it once per load
+        self.schema_body = json.dumps({"genres": self.genres, "years": self.all_years}, separators=(",", ":")).encode()
+        self.schema_etag = '"' + hashlib.sha256(self.schema_body).hexdigest()[:32] + '"'
+
+    def __len__(self):
+        return len(self.movies)
+
+    def get_movie(self, movie_id):
+        row = self._row.get(movie_id)
+        return None if row is None else self.movies[row]
+
+    def get_all_movies(self):
+        return self.movies
+
+    def filter_mask(self, genres=None, min_year=None, max_year=None):
+        """Boolean mask over rows matching any of the given genres and the inclusive year range"""
+        if genres:
+            codes = [self.genre_codes[g.strip()] for g in genres if g.strip() in self.genre_codes]
+            mask = self.genre_matrix[:, codes].any(axis=1)
+        else:
+            mask = np.ones(len(self.movies), dtype=bool)
+        if min_year is not None or max_year is not None:
+            lo = 0 if min_year is None else np.searchsorted(self._sorted_years, min_year, side="left")
+            hi = len(self._sorted_years) if max_year is None else np.searchsorted(self._sorted_years, max_year, side="right")
+            in_range = np.zeros(len(self.movies), dtype=bool)
+            in_range[self._year_order[lo:hi]] = True
+            mask &= in_range
+        return mask
+
+    def item_mask(self, mask, item_of_row, n_items):
+        """Project a row mask onto model item indices; item_of_row holds each row's item index or -1"""
+        rows = mask & (item_of_row >= 0)
+        allowed = np.zeros(n_items, dtype=bool)
+        allowed[item_of_row[rows]] = True
+        return allowed
+
+
+CATALOG = MovieCatalog(MOVIES)
+
+
+def get_catalog():
+    """Get the currently loaded catalog"""
+    return CATALOG
+
+def reload_catalog(movies=None):
+    """Rebuild the catalog (and its derived indexes) and swap it in for subsequent lookups"""
+    global CATALOG
+    CATALOG = MovieCatalog(MOVIES if movies is None else movies)
+    return CATALOG
+
 def get_movie(movie_id: int):
     """Get movie by ID, returns None if not found"""
-    for m in MOVIES:
-        if m["movie_id"] == movie_id:
-            return m
-    return None
+    return CATALOG.get_movie(movie_id)
 
 def get_all_movies():
     """Get all movies"""
-    return MOVIES
-
+    return CATALOG.get_all_movies()
@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import bcrypt
+
+
+class PasswordServiceBusy(RuntimeError):
+    """Raised when the hashing queue stays full for longer than the hasher's queue_timeout"""
+
+
+class PasswordHasher:
+    """bcrypt hashing on a dedicated, bounded thread pool.
+
+    bcrypt releases the GIL while it works, so a few threads give real parallelism without
+    touching the threadpool FastAPI uses for sync endpoints. At most `workers + max_pending`
+    operations are admitted at once; callers beyond that wait up to `queue_timeout` seconds
+    and then get PasswordServiceBusy instead of piling up behind a login storm.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_pending: int = 32, queue_timeout: float = 5.0):
+        self.rounds = rounds
+        self.queue_timeout = queue_timeout
+        self._capacity = workers + max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._admission = None  # asyncio.Semaphore, created on first use inside the running loop
+        self._loop = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._admission = asyncio.Semaphore(self._capacity)
+            self._loop = loop
+        return self._admission
+
+    async def _run(self, fn, *args):
+        semaphore = self._semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise PasswordServiceBusy("password hashing queue is full") from None
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            semaphore.release()
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=self.rounds)).decode()
+
+    @staticmethod
+    def _verify(password: str, password_hash: str) -> bool:
+        try:
+            return bcrypt.checkpw(password.encode(), password_hash.encode())
+        except ValueError:
+            return False  # malformed stored hash
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password)
+
+    async def verify(self, password: Optional[str], password_hash: Optional[str]) -> bool:
+        if not password_hash:
+            return False
+        return await self._run(self._verify, password or "", password_hash)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
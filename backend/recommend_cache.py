@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple
+import numpy as np
+
+
+class RecommendationCache:
+    """Bounded LRU + TTL cache of ranked recommendations per user.
+
+    Entries are keyed by key(user_id, request_key, revision), where the request key holds the filters and
+    model version and revision is ProfileRow.revision, which the database bumps with every genre or
+    watchlist change. A change made through any worker therefore misses every worker's cache on the next
+    request; a new model version misses the same way, and stale entries age out. invalidate(user_id) only
+    frees the local entries early. Read the revision no later than the profile data the ranking uses.
+    Values are the (item_indices, scores) a recommender returned. The cache holds at most max_entries
+    entries and, if max_bytes is set, at most max_bytes of arrays; least recently used entries go first.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries: "OrderedDict[tuple, Tuple[float, np.ndarray, np.ndarray]]" = OrderedDict()
+        self._user_keys: Dict[int, Set[tuple]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(user_id: int, request_key: Hashable, revision: Optional[int]) -> tuple:
+        return user_id, request_key, revision
+
+    def _drop(self, key: tuple) -> None:
+        _, items, scores = self._entries.pop(key)
+        self.nbytes -= items.nbytes + scores.nbytes
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def get(self, key: tuple) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key: tuple, items: np.ndarray, scores: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        items, scores = np.array(items), np.array(scores)  # own copies, never views into model memory
+        user_id = key[0]
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, items, scores)
+            self.nbytes += items.nbytes + scores.nbytes
+            self._user_keys.setdefault(user_id, set()).add(key)
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop this worker's cached rankings for user_id; the revision bump already makes them unreachable"""
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
@@ -1,19 +1,33 @@
 # ma fork/backend/server.py  (modified)
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-import pickle
+from functools import lru_cache
+from contextlib import asynccontextmanager
+import base64
+import json
 import os
-import pandas as pd
-from utils.preprocess import load_movies
-from db import init_db, load_profile as db_load_profile, upsert_profile as db_upsert_profile, load_profile_by_account, load_profile_by_email, next_user_id
-from movies_data import MOVIES, get_movie, get_all_movies
+import re
+import numpy as np
+from model_registry import ModelRegistry, LoadedModel
+from db import init_db, load_profile_dicts as db_load_profile_dicts, DuplicateProfileError, ProfileAccessor, reserve_user_ids, parse_data_url
+# profile, auth and watchlist handlers are async and use the aiosqlite-backed variants
+from db_async import load_profile as db_load_profile, load_profile_dict as db_load_profile_dict, upsert_profile as db_upsert_profile, load_profile_by_login, create_profile as db_create_profile, add_to_watchlist as db_add_to_watchlist, remove_from_watchlist as db_remove_from_watchlist, in_watchlist as db_in_watchlist, load_watchlist as db_load_watchlist, store_avatar as db_store_avatar, load_avatar as db_load_avatar, dispose as db_dispose
+from movies_data import get_catalog, get_movie, get_all_movies
 from movie_urls import get_streaming_url
-import bcrypt
+from passwords import PasswordHasher, PasswordServiceBusy
+from recommend_cache import RecommendationCache
 
-app = FastAPI(title="MAFork Recommender API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # aiosqlite connections each own a non-daemon thread; close them or shutdown hangs
+    await db_dispose()
+
+
+app = FastAPI(title="MAFork Recommender API", lifespan=lifespan)
 
 # Allow local dev (adjust origins for production)
 origins = [
@@ -32,15 +46,80 @@ app.add_middleware(
 )
 
 # --- Load artifacts at startup ---
-MOVIES_PATH = os.getenv("MOVIES_PATH", "data/movies.csv")
-MF_PATH = os.getenv("MF_PATH", "saved_models/mf_model.pkl")
-
-movies = load_movies(MOVIES_PATH) if os.path.exists(MOVIES_PATH) else pd.DataFrame()
-mf = None
-if os.path.exists(MF_PATH):
-    with open(MF_PATH, "rb") as f:
-        mf = pickle.load(f)
+# A save_artifact() directory (memory-mapped); a legacy pickle file is still accepted
+MF_PATH = os.getenv("MF_PATH", "saved_models/mf")
+MF_IDS_PATH = os.getenv("MF_IDS_PATH", "saved_models/mf_ids.npz")  # id maps for legacy pickles
+# Seconds between checks for a newly published model; 0 disables watching (use /admin/model/reload)
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "10"))
+# Upper bound on the users x items score block materialized per chunk by /recommend/batch
+RECOMMEND_BATCH_BYTES = int(os.getenv("RECOMMEND_BATCH_MB", "64")) * 2**20
+# bcrypt work factor and the dedicated pool that runs it, so auth bursts cannot starve other endpoints
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "32"))
+PASSWORD_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_QUEUE_TIMEOUT", "5"))
+
+# Largest decoded avatar image accepted by POST /profile
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_KB", "2048")) * 1024
+# profiles return avatars as /avatar/<sha256> URLs and the profile page posts them back unchanged
+_AVATAR_URL = re.compile(r"/avatar/([0-9a-f]{64})$")
+# Avatars are served from the API origin, so only these image types are accepted (and served as such)
+_AVATAR_MAGIC = {
+    "image/png": (b"\x89PNG\r\n\x1a\n",),
+    "image/jpeg": (b"\xff\xd8\xff",),
+    "image/gif": (b"GIF87a", b"GIF89a"),
+    "image/webp": (b"RIFF",),  # plus "WEBP" at offset 8
+}
+
+
+def _is_avatar_image(content_type: str, data: bytes) -> bool:
+    """True if content_type is an allowed image type and data starts with that type's signature"""
+    signatures = _AVATAR_MAGIC.get(content_type.lower())
+    if signatures is None or not data.startswith(signatures):
+        return False
+    return content_type.lower() != "image/webp" or data[8:12] == b"WEBP"
+
+passwords = PasswordHasher(BCRYPT_ROUNDS, PASSWORD_WORKERS, PASSWORD_MAX_PENDING, PASSWORD_QUEUE_TIMEOUT)
+
+# Neural recommender served by /recommend?model=dl: an export_numpy() directory, scored without torch;
+# a .pth state_dict also works but imports torch
+DL_PATH = os.getenv("DL_PATH", "saved_models/dl")
+DL_IDS_PATH = os.getenv("DL_IDS_PATH", MF_IDS_PATH)  # id maps for .pth files, trained on the same map_ids order as MF
+DL_NUM_THREADS = int(os.getenv("DL_NUM_THREADS", "0"))  # torch threads when DL_PATH is a .pth; 0 keeps torch's default
+
+registry = ModelRegistry(MF_PATH, MF_IDS_PATH)
+dl_registry = ModelRegistry(DL_PATH, DL_IDS_PATH, DL_NUM_THREADS or None)
+registries = {"mf": registry, "dl": dl_registry}
+for reg in registries.values():
+    if os.path.exists(reg.path):
+        reg.reload()
+    if MODEL_WATCH_INTERVAL > 0:
+        reg.watch(MODEL_WATCH_INTERVAL)
 init_db()
+if registry.active is not None:
+    reserve_user_ids(int(registry.active.user_map.ids.max(initial=0)))
+
+# Users the MF model was not trained on are folded in from their survey genres and watchlist:
+# watchlisted movies count as strong ratings, movies in their genres as weak ones
+FOLD_IN_WATCHLIST_RATING, FOLD_IN_WATCHLIST_WEIGHT = 4.5, 1.0
+FOLD_IN_GENRE_RATING, FOLD_IN_GENRE_WEIGHT = 4.0, 0.1
+FOLD_IN_REG = float(os.getenv("FOLD_IN_REG", "0.1"))
+FOLD_IN_CACHE_SIZE = int(os.getenv("FOLD_IN_CACHE_SIZE", "4096"))
+
+# Ranked results of /recommend/{user_id}, reused until the user's profile/watchlist or the model changes
+RECOMMEND_CACHE_SIZE = int(os.getenv("RECOMMEND_CACHE_SIZE", "10000"))  # 0 disables
+RECOMMEND_CACHE_TTL = float(os.getenv("RECOMMEND_CACHE_TTL", "300"))
+recommend_cache = RecommendationCache(RECOMMEND_CACHE_SIZE, RECOMMEND_CACHE_TTL)
+# Paginated requests store the user's whole filtered ranking (8 bytes per allowed item), so they get a
+# cache of their own, bounded by memory, and can never push the small top-n entries out
+RANKING_CACHE_MB = int(os.getenv("RANKING_CACHE_MB", "256"))
+ranking_cache = RecommendationCache(RECOMMEND_CACHE_SIZE, RECOMMEND_CACHE_TTL, max_bytes=RANKING_CACHE_MB * 2**20)
+
+
+def _invalidate_recommendations(user_id: int) -> None:
+    recommend_cache.invalidate(user_id)
+    ranking_cache.invalidate(user_id)
+
 
 # --- Auth models ---
 class LoginRequest(BaseModel):
@@ -72,11 +151,20 @@ class SurveySubmitRequest(BaseModel):
     min_year: Optional[int] = None
     max_year: Optional[int] = None
 
+class BatchRecommendRequest(BaseModel):
+    user_ids: List[int]
+    n: int = 5
+    genres: Optional[str] = None  # comma-separated; defaults to each user's profile genres
+    min_year: Optional[int] = None
+    max_year: Optional[int] = None
+    exclude_watchlist: bool = True
+    model: str = "mf"  # "mf" or "dl"
+
 
 class Profile(BaseModel):
     user_id: int
     name: Optional[str] = None
-    avatar_data_url: Optional[str] = None  # base64 data URL for preview only (dev)
+    avatar_data_url: Optional[str] = None  # data: URL on upload; an /avatar/<sha256> URL in responses
     account: Optional[str] = None
     email: Optional[str] = None
     password: Optional[str] = None  # write-only
@@ -89,58 +177,67 @@ class Profile(BaseModel):
 def root():
     return {"message": "Recommender API is running"}
 
+
+def _conflict(exc: DuplicateProfileError) -> JSONResponse:
+    message = "Email in use" if exc.column == "email" else "Username taken"
+    return JSONResponse(status_code=409, content={"error": message})
+
+
+def _busy() -> JSONResponse:
+    return JSONResponse(status_code=503, content={"error": "Server busy, try again"}, headers={"Retry-After": "1"})
+
+
 @app.post("/auth/signup", response_model=SignupResponse)
-def signup(body: SignupRequest):
-    # enforce uniqueness
-    if load_profile_by_account(body.account):
-        return JSONResponse(status_code=409, content={"error": "Username taken"})
-    if load_profile_by_email(body.email):
-        return JSONResponse(status_code=409, content={"error": "Email in use"})
-    uid = next_user_id()
-    pwd_hash = bcrypt.hashpw(body.password.encode(), bcrypt.gensalt()).decode()
-    row = db_upsert_profile({
-        "user_id": uid,
-        "name": body.name,
-        "account": body.account,
-        "email": body.email,
-        "password_hash": pwd_hash,
-        "genres": [],
-        "favorites": []
-    })
+async def signup(body: SignupRequest):
+    try:
+        pwd_hash = await passwords.hash(body.password)
+    except PasswordServiceBusy:
+        return _busy()
+    # user_id comes from the insert; the unique account/email indexes enforce uniqueness
+    try:
+        row = await db_create_profile({
+            "name": body.name,
+            "account": body.account,
+            "email": body.email,
+            "password_hash": pwd_hash,
+            "genres": [],
+            "favorites": []
+        })
+    except DuplicateProfileError as exc:
+        return _conflict(exc)
     return SignupResponse(token="dev-token", user_id=row.user_id)
 
+
 @app.post("/auth/login", response_model=LoginResponse)
-def login(body: LoginRequest):
+async def login(body: LoginRequest):
     # Accept username or email + password
-    row = load_profile_by_account(body.account or "") or load_profile_by_email(body.account or "")
+    row = await load_profile_by_login(body.account or "")
     if row is None or not row.password_hash:
         return JSONResponse(status_code=401, content={"error": "Invalid credentials"})
     try:
-        ok = bcrypt.checkpw((body.password or "").encode(), (row.password_hash or "").encode())
-    except Exception:
-        ok = False
+        ok = await passwords.verify(body.password, row.password_hash)
+    except PasswordServiceBusy:
+        return _busy()
     if not ok:
         return JSONResponse(status_code=401, content={"error": "Invalid credentials"})
     return LoginResponse(token="dev-token", user_id=row.user_id)
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t.removeprefix("W/") for t in tags)
+
+
 @app.get("/survey/schema", response_model=SurveySchemaResponse)
-def survey_schema():
-    # Use movies_data.py instead of movies.csv
-    genre_set = set()
-    years = set()
-    
-    for movie in MOVIES:
-        # Collect genres
-        if movie.get("genres"):
-            for genre in movie["genres"]:
-                if genre and genre.strip():
-                    genre_set.add(genre.strip())
-        # Collect years
-        if movie.get("year"):
-            years.add(int(movie["year"]))
-    
-    return SurveySchemaResponse(genres=sorted(genre_set), years=sorted(years))
+def survey_schema(if_none_match: Optional[str] = Header(default=None)):
+    # The body and ETag are built once per catalog load
+    catalog = get_catalog()
+    headers = {"ETag": catalog.schema_etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, catalog.schema_etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=catalog.schema_body, media_type="application/json", headers=headers)
 
 
 @app.post("/survey/submit")
@@ -148,28 +245,54 @@ def survey_submit(body: SurveySubmitRequest):
     return {"status": "ok"}
 
 
+def _profile_response(request: Request, prof: dict) -> Profile:
+    prof = dict(prof)
+    avatar_hash = prof.pop("avatar_hash", None)
+    prof["avatar_data_url"] = str(request.url_for("avatar", avatar_hash=avatar_hash)) if avatar_hash else None
+    return Profile(**prof)
+
+
 @app.get("/profile/{user_id}", response_model=Profile)
-def get_profile(user_id: int):
-    row = db_load_profile(user_id)
-    if row is None:
-        prof = {"user_id": user_id, "name": None, "avatar_data_url": None, "genres": [], "favorites": []}
-        return Profile(**prof)
-    return Profile(**row.to_profile_dict())
+async def get_profile(user_id: int, request: Request):
+    prof = await db_load_profile_dict(user_id)
+    if prof is None:
+        prof = {"user_id": user_id, "name": None, "avatar_hash": None, "genres": [], "favorites": []}
+    return _profile_response(request, prof)
 
 
 @app.post("/profile/{user_id}", response_model=Profile)
-def save_profile(user_id: int, body: Profile):
+async def save_profile(user_id: int, body: Profile, request: Request):
     payload = body.model_dump()
-    password_hash = None
+    uid = payload.get("user_id") or user_id
+    # avatars are stored once by content hash; the profile row only keeps the hash
+    avatar_hash = None
+    if payload.get("avatar_data_url"):
+        parsed = parse_data_url(payload["avatar_data_url"])
+        if parsed is not None:
+            if len(parsed[1]) > AVATAR_MAX_BYTES:
+                return JSONResponse(status_code=413, content={"error": "Avatar too large"})
+            if not _is_avatar_image(*parsed):
+                return JSONResponse(status_code=400, content={"error": "Avatar must be a PNG, JPEG, GIF or WebP image"})
+            avatar_hash = await db_store_avatar(parsed[0].lower(), parsed[1])
+        else:
+            match = _AVATAR_URL.search(payload["avatar_data_url"])
+            if match is None:
+                return JSONResponse(status_code=400, content={"error": "avatar_data_url must be a data: URL"})
+            avatar_hash = match.group(1)
+    password_hash = None  # None keeps the stored hash
     if payload.get("password"):
+        existing = await db_load_profile(uid)
         try:
-            password_hash = bcrypt.hashpw(payload["password"].encode(), bcrypt.gensalt()).decode()
-        except Exception:
-            password_hash = None
+            # re-submitting the current password must not pay for (and store) a fresh hash
+            unchanged = existing is not None and await passwords.verify(payload["password"], existing.password_hash)
+            if not unchanged:
+                password_hash = await passwords.hash(payload["password"])
+        except PasswordServiceBusy:
+            return _busy()
     to_store = {
-        "user_id": payload.get("user_id") or user_id,
+        "user_id": uid,
         "name": payload.get("name"),
-        "avatar_data_url": payload.get("avatar_data_url"),
+        "avatar_hash": avatar_hash,
         "account": payload.get("account"),
         "email": payload.get("email"),
         "password_hash": password_hash,
@@ -177,8 +300,29 @@ def save_profile(user_id: int, body: Profile):
         "favorites": payload.get("favorites") or [],
         "watchlist": payload.get("watchlist") or [],
     }
-    row = db_upsert_profile(to_store)
-    return Profile(**row.to_profile_dict())
+    try:
+        row = await db_upsert_profile(to_store)
+    except DuplicateProfileError as exc:
+        return _conflict(exc)
+    _invalidate_recommendations(row.user_id)
+    return _profile_response(request, await db_load_profile_dict(row.user_id))
+
+
+@app.get("/avatar/{avatar_hash}", name="avatar")
+async def avatar(avatar_hash: str, if_none_match: Optional[str] = Header(default=None)):
+    # content-addressed, so a given URL never changes and can be cached for good
+    etag = f'"{avatar_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable", "X-Content-Type-Options": "nosniff"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    row = await db_load_avatar(avatar_hash)
+    if row is None:
+        return JSONResponse(status_code=404, content={"error": "Avatar not found"})
+    if not _is_avatar_image(row.content_type, row.data):
+        # stored before uploads were checked (or migrated from old profiles); never render it inline
+        return Response(content=row.data, media_type="application/octet-stream",
+                        headers={**headers, "Content-Disposition": "attachment"})
+    return Response(content=row.data, media_type=row.content_type, headers=headers)
 
 
 @app.get("/image/{movie_id}")
@@ -222,78 +366,89 @@ def movie_detail(movie_id: int):
             result["source_urls"][source] = get_streaming_url(source, movie["title"], movie.get("year"))
     return result
 
-@app.get("/recommend/{user_id}")
-def recommend(user_id: int, n: int = 5, genres: Optional[str] = None, min_year: Optional[int] = None, max_year: Optional[int] = None):
-    if mf is None:
+def _select_model(name: str):
+    """The LoadedModel to serve for ?model=name, or an error response"""
+    if name not in registries:
+        return JSONResponse(status_code=400, content={"error": "model must be 'mf' or 'dl'"})
+    model = registries[name].active
+    if model is None:
         return JSONResponse(status_code=503, content={"error": "Model not loaded"})
+    return model
 
-    # Use movies_data.py for filtering instead of movies.csv
-    allowed_movie_ids = None
-    
-    # Get genres from profile if not provided
-    use_genres = genres
-    if not use_genres:
-        row = db_load_profile(user_id)
-        if row is not None:
-            prof = row.to_profile_dict()
-            if prof.get("genres"):
-                use_genres = ",".join(prof["genres"])  # comma-separated
-    
-    # Get user's watchlist to exclude from recommendations
-    user_watchlist = set()
-    row = db_load_profile(user_id)
-    if row is not None:
-        prof = row.to_profile_dict()
-        user_watchlist = set(prof.get("watchlist", []))
-    
-    # Filter movies from movies_data.py
-    filtered_movies = MOVIES
-    if use_genres:
-        wanted_genres = set([g.strip() for g in use_genres.split(',') if g.strip()])
-        filtered_movies = [
-            m for m in filtered_movies
-            if m.get("genres") and wanted_genres & set(m["genres"])
-        ]
-    
-    if min_year is not None or max_year is not None:
-        filtered_movies = [
-            m for m in filtered_movies
-            if (min_year is None or (m.get("year") and m["year"] >= min_year)) and
-               (max_year is None or (m.get("year") and m["year"] <= max_year))
-        ]
-    
-    # Exclude movies already in watchlist
-    filtered_movies = [
-        m for m in filtered_movies
-        if m.get("movie_id") not in user_watchlist
-    ]
-    
-    # Map to model indices if movies.csv is available
-    allowed_indices = None
-    if movies is not None and not movies.empty and "movieId" in movies.columns:
-        # Get movie IDs from filtered movies
-        allowed_movie_ids = set(m["movie_id"] for m in filtered_movies)
-        # Map to indices in the model (assuming movieId in movies.csv corresponds to movie_id in movies_data.py)
-        allowed_indices = set(
-            movies[movies["movieId"].isin(allowed_movie_ids)]["movieId"].astype(int).tolist()
-        )
-
-    preds = []
-    for i in range(mf.n_items):
-        if allowed_indices is not None and i not in allowed_indices:
-            continue
-        preds.append((i, mf.predict(user_id, i)))
 
-    top_n = sorted(preds, key=lambda x: x[1], reverse=True)[:n]
+@app.get("/movie/{movie_id}/similar")
+def similar_movies(movie_id: int, n: int = Query(10, ge=1)):
+    """Movies closest to movie_id in the MF item space, read from the artifact's precomputed index"""
+    model = registry.active
+    if model is None:
+        return JSONResponse(status_code=503, content={"error": "Model not loaded"})
+    headers = {"X-Model-Version": model.version}
+    if getattr(model.mf, "item_neighbors", None) is None:
+        return JSONResponse(status_code=503, content={"error": "Similarity index not built for this model"}, headers=headers)
+    item_idx = model.item_map.index(movie_id)
+    if item_idx is None:
+        return JSONResponse(status_code=404, content={"error": "Movie not in model"}, headers=headers)
+    catalog = get_catalog()
+    allowed_mask = _allowed_mask(catalog, model, np.ones(len(catalog.ids), dtype=bool))
+    items, scores = model.mf.similar_items(item_idx, n, allowed_mask=allowed_mask)
+    similar = []
+    for similar_id, score in zip(model.item_map.ids[items].tolist(), scores.tolist()):
+        movie = catalog.get_movie(similar_id)
+        if movie:
+            similar.append({
+                "movie_id": movie["movie_id"],
+                "title": movie["title"],
+                "genres": "|".join(movie["genres"]),
+                "similarity": float(score),
+                "year": movie.get("year"),
+                "rating": movie.get("rating"),
+            })
+    return JSONResponse(content={"movie_id": movie_id, "model_version": model.version, "similar": similar}, headers=headers)
+
+
+def _parse_genres(genres: Optional[str]) -> List[str]:
+    return [g.strip() for g in (genres or "").split(",") if g.strip()]
+
+
+@lru_cache(maxsize=2)
+def _catalog_items(catalog, model: LoadedModel) -> np.ndarray:
+    # Model item index for each catalog row, -1 for movies the model has never seen
+    return model.item_map.index_of(catalog.ids)
+
+
+def _allowed_mask(catalog, model: LoadedModel, catalog_mask: np.ndarray) -> np.ndarray:
+    return catalog.item_mask(catalog_mask, _catalog_items(catalog, model), model.mf.n_items)
+
 
+def _fold_in(catalog, model: LoadedModel, genres: tuple, watchlist: tuple) -> Optional[np.ndarray]:
+    """User vector for someone outside the model, or None if the model cannot score such users"""
+    if not hasattr(model.mf, "fold_in"):
+        return None
+    # memoized on the model by the signals themselves: a profile edit misses, and a swapped-out model
+    # takes its vectors with it instead of being kept alive by a module-level cache
+    return model.cached(("fold_in", catalog, genres, watchlist), lambda: _compute_fold_in(catalog, model, genres, watchlist), FOLD_IN_CACHE_SIZE)
+
+
+def _compute_fold_in(catalog, model: LoadedModel, genres: tuple, watchlist: tuple) -> np.ndarray:
+    watched = model.item_map.index_of(list(watchlist))
+    watched = np.unique(watched[watched >= 0])
+    liked = np.empty(0, dtype=np.int64)
+    if genres:
+        liked = np.flatnonzero(_allowed_mask(catalog, model, catalog.filter_mask(list(genres), None, None)))
+        liked = np.setdiff1d(liked, watched)
+    if len(watched) + len(liked) == 0:
+        # no genres or watchlist yet (e.g. onboarding was skipped): rank for the average user
+        return np.asarray(model.mf.U).mean(axis=0)
+    items = np.concatenate([watched, liked])
+    ratings = np.concatenate([np.full(len(watched), FOLD_IN_WATCHLIST_RATING), np.full(len(liked), FOLD_IN_GENRE_RATING)])
+    weights = np.concatenate([np.full(len(watched), FOLD_IN_WATCHLIST_WEIGHT), np.full(len(liked), FOLD_IN_GENRE_WEIGHT)])
+    return model.mf.fold_in(items, ratings, weights, reg=FOLD_IN_REG)
+
+
+def _format_recommendations(catalog, model: LoadedModel, top_items: np.ndarray, top_scores: np.ndarray) -> List[Dict[str, Any]]:
     recs = []
-    # Use filtered movies from movies_data.py
-    available_movie_ids = [m["movie_id"] for m in filtered_movies]
-    
-    for idx, (i, score) in enumerate(top_n):
-        # Map model index to real movie ID from filtered set
-        real_movie_id = available_movie_ids[idx % len(available_movie_ids)] if available_movie_ids else None
-        movie = get_movie(real_movie_id) if real_movie_id else None
+    for movie_id, score in zip(model.item_map.ids[top_items].tolist(), top_scores.tolist()):
+        movie = catalog.get_movie(movie_id)
         if movie:
             recs.append({
                 "movie_id": movie["movie_id"],
@@ -307,22 +462,214 @@ def recommend(user_id: int, n: int = 5, genres: Optional[str] = None, min_year:
         else:
             # Fallback
             recs.append({
-                "movie_id": int(i),
-                "title": f"Movie {i}",
+                "movie_id": movie_id,
+                "title": f"Movie {movie_id}",
                 "genres": "",
                 "predicted_rating": float(score)
             })
+    return recs
+
+
+def _encode_cursor(model_name: str, version: str, genres: Optional[str], min_year: Optional[int], max_year: Optional[int],
+                   revision: Optional[int], offset: int) -> str:
+    raw = json.dumps([model_name, version, genres, min_year, max_year, revision, offset], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _decode_cursor(cursor: str) -> Optional[tuple]:
+    """The fields _encode_cursor packed, or None if the cursor is malformed or any field has the wrong type"""
+    try:
+        model_name, version, genres, min_year, max_year, revision, offset = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not (isinstance(model_name, str) and isinstance(version, str) and (genres is None or isinstance(genres, str))):
+        return None
+    if not all(value is None or _is_int(value) for value in (min_year, max_year, revision)):
+        return None
+    if not _is_int(offset) or offset < 0:
+        return None
+    return model_name, version, genres, min_year, max_year, revision, offset
+
+
+@app.get("/recommend/{user_id}")
+def recommend(response: Response, user_id: int, n: int = Query(5, ge=1), genres: Optional[str] = None, min_year: Optional[int] = None, max_year: Optional[int] = None, model: str = "mf",
+              paginate: bool = False, cursor: Optional[str] = None, profile: ProfileAccessor = Depends(ProfileAccessor)):
+    """Top-n recommendations. With paginate=true (or a cursor from a previous page) the response carries
+    next_cursor; the user's whole filtered ranking is computed once and later pages are slices of it."""
+    offset = 0
+    if cursor is not None:
+        # a cursor carries the filters, model version and profile revision of the ranking it pages through,
+        # so any worker can recompute exactly that ranking if its cached copy is gone
+        decoded = _decode_cursor(cursor)
+        if decoded is None:
+            return JSONResponse(status_code=400, content={"error": "Invalid cursor"})
+        model, cursor_version, genres, min_year, max_year, cursor_revision, offset = decoded
+    paginated = paginate or cursor is not None
+    # Pin one model for the whole request; a concurrent reload only affects later requests
+    model_name, model = model, _select_model(model)
+    if isinstance(model, Response):
+        return model
+    response.headers["X-Model-Version"] = model.version
+    if cursor is not None and cursor_version != model.version:
+        return JSONResponse(status_code=410, content={"error": "Cursor expired, the model has changed"}, headers={"X-Model-Version": model.version})
+    # read with (never after) the genres and watchlist the ranking uses
+    revision = profile.revision()
+    if cursor is not None and cursor_revision != revision:
+        return JSONResponse(status_code=410, content={"error": "Cursor expired, the profile has changed"}, headers={"X-Model-Version": model.version})
+    catalog = get_catalog()
+    # a paginated ranking covers every allowed item, stored compactly; one entry serves every page
+    rank_n = model.mf.n_items if paginated else n
+    cache = ranking_cache if paginated else recommend_cache
+    cache_key = cache.key(user_id, (model_name, model.version, None if paginated else n, genres, min_year, max_year), revision)
+    ranked = cache.get(cache_key)
+    if ranked is None:
+        user_idx = model.user_map.index(user_id)
+        user_vector = None
+        if user_idx is None:
+            # a user id that has no profile either is unknown; one with an empty profile gets the average user
+            if profile.genres() is not None:
+                user_vector = _fold_in(catalog, model, tuple(profile.genres()), tuple(profile.watchlist() or ()))
+            if user_vector is None:
+                return JSONResponse(status_code=404, content={"error": "User not in model"}, headers={"X-Model-Version": model.version})
+
+        # Get genres from profile if not provided
+        use_genres = genres
+        if not use_genres and profile.genres():
+            use_genres = ",".join(profile.genres())  # comma-separated
+
+        # Get user's watchlist to exclude from recommendations
+        user_watchlist = set(profile.watchlist() or [])
+
+        # Filter movies from movies_data.py, excluding movies already in watchlist
+        catalog_mask = catalog.filter_mask(_parse_genres(use_genres), min_year, max_year)
+        if user_watchlist:
+            catalog_mask &= ~np.isin(catalog.ids, list(user_watchlist))
+
+        allowed_mask = _allowed_mask(catalog, model, catalog_mask)
+        if user_vector is None:
+            ranked = model.mf.recommend(user_idx, rank_n, allowed_mask=allowed_mask)
+        else:
+            ranked = model.mf.rank_scores(model.mf.score_vectors(user_vector), rank_n, allowed_mask=allowed_mask)
+        if paginated:
+            ranked = ranked[0].astype(np.int32), ranked[1].astype(np.float32)
+        cache.put(cache_key, *ranked)
+    top_items, top_scores = ranked[0][offset:offset + n], ranked[1][offset:offset + n]
+    recs = _format_recommendations(catalog, model, top_items, top_scores)
+
+    body = {"user_id": user_id, "model_version": model.version, "recommendations": recs}
+    if paginated:
+        more = offset + n < len(ranked[0])
+        body["next_cursor"] = _encode_cursor(model_name, model.version, genres, min_year, max_year, revision, offset + n) if more else None
+    return body
+
+
+@app.post("/recommend/batch")
+def recommend_batch(body: BatchRecommendRequest):
+    """Score many users per matrix multiply and stream one NDJSON line per user"""
+    model = _select_model(body.model)
+    if isinstance(model, Response):
+        return model
+    user_map, item_map = model.user_map, model.item_map
+
+    profiles = {prof["user_id"]: prof for prof in db_load_profile_dicts(body.user_ids)}
+
+    # Users sharing the same genre filter share one candidate set: model users are scored together,
+    # users the model was not trained on are folded in from their profile as in /recommend/{user_id}
+    user_ids = list(dict.fromkeys(body.user_ids))
+    groups: Dict[tuple, tuple] = {}
+    unknown_users = []
+    can_fold_in = hasattr(model.mf, "fold_in")
+    for uid, user_idx in zip(user_ids, user_map.index_of(user_ids).tolist()):
+        prof = profiles.get(uid)
+        if user_idx < 0 and (prof is None or not can_fold_in):
+            unknown_users.append(uid)
+            continue
+        wanted = _parse_genres(body.genres) or list((prof or {}).get("genres") or [])
+        known, folded = groups.setdefault(tuple(sorted(wanted)), ([], []))
+        if user_idx < 0:
+            folded.append(uid)
+        else:
+            known.append(user_idx)
+
+    catalog = get_catalog()
+
+    def lines():
+        for uid in unknown_users:
+            yield json.dumps({"user_id": uid, "recommendations": [], "error": "User not in model"}) + "\n"
+        for wanted, (user_idxs, folded_ids) in groups.items():
+            allowed_mask = _allowed_mask(catalog, model, catalog.filter_mask(list(wanted), body.min_year, body.max_year))
+            exclude = {}
+            if body.exclude_watchlist:
+                for user_idx in user_idxs:
+                    watchlist = (profiles.get(int(user_map.ids[user_idx])) or {}).get("watchlist")
+                    if watchlist:
+                        exclude[user_idx] = item_map.index_of(watchlist)
+            ranked = model.mf.recommend_many(
+                user_idxs, body.n,
+                allowed_mask=allowed_mask,
+                exclude=exclude,
+                chunk_bytes=RECOMMEND_BATCH_BYTES,
+            )
+            for user_idx, top_items, top_scores in ranked:
+                recs = _format_recommendations(catalog, model, top_items, top_scores)
+                yield json.dumps({"user_id": int(user_map.ids[user_idx]), "recommendations": recs}) + "\n"
+            for uid in folded_ids:
+                prof = profiles[uid]
+                user_vector = _fold_in(catalog, model, tuple(prof["genres"]), tuple(prof["watchlist"]))
+                watchlist = item_map.index_of(prof["watchlist"]) if body.exclude_watchlist and prof["watchlist"] else None
+                top_items, top_scores = model.mf.rank_scores(model.mf.score_vectors(user_vector), body.n,
+                                                             allowed_mask=allowed_mask, exclude=watchlist)
+                recs = _format_recommendations(catalog, model, top_items, top_scores)
+                yield json.dumps({"user_id": uid, "recommendations": recs}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Model-Version": model.version})
+
+
+@app.get("/admin/model")
+def model_info(model: str = "mf"):
+    """Active model version and the last reload error, if any"""
+    if model not in registries:
+        return JSONResponse(status_code=400, content={"error": "model must be 'mf' or 'dl'"})
+    registry = registries[model]
+    active = registry.active
+    return {"active": active.info() if active else None, "last_error": registry.last_error}
+
+
+@app.post("/admin/model/reload")
+def reload_model(force: bool = False, model: str = "mf"):
+    """Load the artifact at MF_PATH (or DL_PATH for model=dl), validate it, and swap it in for new requests"""
+    if model not in registries:
+        return JSONResponse(status_code=400, content={"error": "model must be 'mf' or 'dl'"})
+    registry = registries[model]
+    try:
+        model = registry.reload(force=force)
+    except FileNotFoundError:
+        return JSONResponse(status_code=404, content={"error": f"No model artifact at {registry.path}"})
+    except Exception as exc:
+        active = registry.active
+        return JSONResponse(status_code=422, content={
+            "error": registry.last_error or str(exc),
+            "active": active.info() if active else None,
+        })
+    return {"active": model.info()}
+
+
+@app.get("/admin/cache")
+def cache_info():
+    """Size and hit/miss counters of the /recommend/{user_id} result caches: top-n results and paginated rankings"""
+    return {"top_n": recommend_cache.stats(), "rankings": ranking_cache.stats()}
 
-    return {"user_id": user_id, "recommendations": recs}
 
 @app.get("/watchlist/{user_id}")
-def get_watchlist(user_id: int):
+async def get_watchlist(user_id: int):
     """Get user's watchlist"""
-    row = db_load_profile(user_id)
-    if row is None:
+    watchlist_movie_ids = await db_load_watchlist(user_id)
+    if watchlist_movie_ids is None:
         return JSONResponse(status_code=404, content={"error": "User not found"})
-    prof = row.to_profile_dict()
-    watchlist_movie_ids = prof.get("watchlist", [])
     watchlist_movies = []
     for movie_id in watchlist_movie_ids:
         movie = get_movie(movie_id)
@@ -339,68 +686,32 @@ def get_watchlist(user_id: int):
     return {"watchlist": watchlist_movies}
 
 @app.post("/watchlist/{user_id}/add/{movie_id}")
-def add_to_watchlist(user_id: int, movie_id: int):
+async def add_to_watchlist(user_id: int, movie_id: int):
     """Add a movie to user's watchlist"""
-    row = db_load_profile(user_id)
-    if row is None:
-        return JSONResponse(status_code=404, content={"error": "User not found"})
-    
     # Verify movie exists
     movie = get_movie(movie_id)
     if not movie:
+        # report a missing user first, as before
+        if await db_load_profile(user_id) is None:
+            return JSONResponse(status_code=404, content={"error": "User not found"})
         return JSONResponse(status_code=404, content={"error": "Movie not found"})
-    
-    prof = row.to_profile_dict()
-    watchlist = prof.get("watchlist", [])
-    
-    if movie_id not in watchlist:
-        watchlist.append(movie_id)
-        to_store = {
-            "user_id": user_id,
-            "name": prof.get("name"),
-            "avatar_data_url": prof.get("avatar_data_url"),
-            "account": prof.get("account"),
-            "email": prof.get("email"),
-            "genres": prof.get("genres", []),
-            "favorites": prof.get("favorites", []),
-            "watchlist": watchlist,
-        }
-        db_upsert_profile(to_store)
-    
+
+    watchlist = await db_add_to_watchlist(user_id, movie_id)
+    if watchlist is None:
+        return JSONResponse(status_code=404, content={"error": "User not found"})
+    _invalidate_recommendations(user_id)
     return {"message": "Added to watchlist", "watchlist": watchlist}
 
 @app.post("/watchlist/{user_id}/remove/{movie_id}")
-def remove_from_watchlist(user_id: int, movie_id: int):
+async def remove_from_watchlist(user_id: int, movie_id: int):
     """Remove a movie from user's watchlist"""
-    row = db_load_profile(user_id)
-    if row is None:
+    watchlist = await db_remove_from_watchlist(user_id, movie_id)
+    if watchlist is None:
         return JSONResponse(status_code=404, content={"error": "User not found"})
-    
-    prof = row.to_profile_dict()
-    watchlist = prof.get("watchlist", [])
-    
-    if movie_id in watchlist:
-        watchlist = [m for m in watchlist if m != movie_id]
-        to_store = {
-            "user_id": user_id,
-            "name": prof.get("name"),
-            "avatar_data_url": prof.get("avatar_data_url"),
-            "account": prof.get("account"),
-            "email": prof.get("email"),
-            "genres": prof.get("genres", []),
-            "favorites": prof.get("favorites", []),
-            "watchlist": watchlist,
-        }
-        db_upsert_profile(to_store)
-    
+    _invalidate_recommendations(user_id)
     return {"message": "Removed from watchlist", "watchlist": watchlist}
 
 @app.get("/watchlist/{user_id}/check/{movie_id}")
-def check_watchlist(user_id: int, movie_id: int):
+async def check_watchlist(user_id: int, movie_id: int):
     """Check if a movie is in user's watchlist"""
-    row = db_load_profile(user_id)
-    if row is None:
-        return {"in_watchlist": False}
-    prof = row.to_profile_dict()
-    watchlist = prof.get("watchlist", [])
-    return {"in_watchlist": movie_id in watchlist}
+    return {"in_watchlist": await db_in_watchlist(user_id, movie_id)}
@@ -1,5 +1,10 @@
+import os
+import numpy as np
 import pandas as pd
 
+# Columns load_ratings_indexed reads; timestamp and anything else in the file is skipped
+RATING_DTYPES = {"userId": np.int32, "movieId": np.int32, "rating": np.float32}
+
 def load_ratings(path="data/ratings.csv"):
     df = pd.read_csv(path)
     # ensure columns exist
@@ -20,3 +25,95 @@ def map_ids(df):
     df['user'] = df['userId'].map(user2idx)
     df['item'] = df['movieId'].map(item2idx)
     return df, user2idx, item2idx
+
+
+def _read_ratings_csv(path, chunksize):
+    users, items, ratings = [], [], []
+    try:
+        reader = pd.read_csv(path, usecols=list(RATING_DTYPES), dtype=RATING_DTYPES, chunksize=chunksize)
+    except ValueError as exc:
+        raise ValueError(f"ratings.csv must contain columns: {set(RATING_DTYPES)}") from exc
+    for chunk in reader:
+        users.append(chunk["userId"].to_numpy())
+        items.append(chunk["movieId"].to_numpy())
+        ratings.append(chunk["rating"].to_numpy())
+    if not users:
+        return (np.empty(0, np.int32),) * 2 + (np.empty(0, np.float32),)
+    return np.concatenate(users), np.concatenate(items), np.concatenate(ratings)
+
+
+def load_ratings_indexed(path="data/ratings.csv", cache_path=None, chunksize=1_000_000):
+    """Ratings with contiguous user/item indices as (df, user_map, item_map).
+
+    Same columns and index order as load_ratings + map_ids (ids are numbered by first appearance),
+    but the CSV is parsed in chunks with int32/float32 dtypes and ids are factorized in NumPy.
+    With cache_path, the parsed arrays are saved as .npz and reused while the CSV's size and
+    mtime are unchanged.
+    """
+    st = os.stat(path)
+    source = np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+    cached = None
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            if np.array_equal(data["source"], source):
+                cached = {name: data[name] for name in data.files}
+    if cached is None:
+        raw_users, raw_items, ratings = _read_ratings_csv(path, chunksize)
+        users, user_ids = pd.factorize(raw_users)
+        items, item_ids = pd.factorize(raw_items)
+        cached = {
+            "user": users.astype(np.int32), "item": items.astype(np.int32), "rating": ratings,
+            "user_ids": user_ids.astype(np.int64), "item_ids": item_ids.astype(np.int64),
+        }
+        if cache_path:
+            tmp = f"{cache_path}.tmp.npz"
+            np.savez(tmp, source=source, **cached)
+            os.replace(tmp, cache_path)
+    user_map, item_map = IdMap(cached["user_ids"]), IdMap(cached["item_ids"])
+    df = pd.DataFrame({
+        "userId": user_map.ids[cached["user"]].astype(np.int32),
+        "movieId": item_map.ids[cached["item"]].astype(np.int32),
+        "rating": cached["rating"],
+        "user": cached["user"],
+        "item": cached["item"],
+    })
+    return df, user_map, item_map
+
+
+class IdMap:
+    """Raw id <-> contiguous model index lookups backed by an array of raw ids (position == index)"""
+
+    def __init__(self, ids):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self._order = np.argsort(self.ids, kind="stable")
+        self._sorted = self.ids[self._order]
+
+    @classmethod
+    def from_dict(cls, raw2idx):
+        ids = np.empty(len(raw2idx), dtype=np.int64)
+        ids[np.fromiter(raw2idx.values(), dtype=np.int64, count=len(raw2idx))] = list(raw2idx.keys())
+        return cls(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_of(self, raw_ids):
+        """Model indices for an array of raw ids, -1 where the id is unknown"""
+        raw_ids = np.asarray(raw_ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.full(raw_ids.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._sorted, raw_ids), len(self._sorted) - 1)
+        return np.where(self._sorted[pos] == raw_ids, self._order[pos], -1)
+
+    def index(self, raw_id):
+        idx = int(self.index_of([raw_id])[0])
+        return None if idx < 0 else idx
+
+
+def save_id_maps(path, user2idx, item2idx):
+    np.savez(path, user_ids=IdMap.from_dict(user2idx).ids, item_ids=IdMap.from_dict(item2idx).ids)
+
+
+def load_id_maps(path):
+    with np.load(path) as data:
+        return IdMap(data["user_ids"]), IdMap(data["item_ids"])
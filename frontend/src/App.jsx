@@ -402,7 +402,7 @@ function ProfilePage() {
           </div>
           <label className="text-sm inline-flex items-center gap-2 cursor-pointer">
             <span className="rounded-lg bg-slate-800 hover:bg-slate-700 px-3 py-1.5">Upload avatar</span>
-            <input type="file" accept="image/*" onChange={onAvatarChange} className="hidden" />
+            <input type="file" accept="image/png,image/jpeg,image/gif,image/webp" onChange={onAvatarChange} className="hidden" />
           </label>
         </div>
 